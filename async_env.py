@@ -0,0 +1,75 @@
+import asyncio
+
+from env_pool import SubprocEnvPool
+from walker import BipedalWalker
+
+# asyncio front end for SubprocEnvPool: waiting for the workers is an await on their pipes
+# (registered with the event loop, no helper threads), so while one group of envs runs physics
+# the event loop can hand the CPU to code serving another group, e.g. policy inference.
+#
+#     async def run_group(envs):
+#         obs = await envs.reset()
+#         while True:
+#             obs, rewards, dones, infos = await envs.step(policy(obs))
+#
+#     groups = [AsyncEnvPool(8, num_workers=4) for _ in range(2)]
+#     loop.run_until_complete(asyncio.gather(*[run_group(envs) for envs in groups]))
+#
+# policy() runs in the event loop thread; with two groups it computes the actions of one group
+# while the workers of the other are stepping. step_async() / step_wait() split the call the same
+# way as on SubprocEnvPool, only step_wait() is a coroutine.
+
+
+async def _recv(conn):
+    loop = asyncio.get_event_loop()
+    if not conn.poll():
+        fd = conn.fileno()
+        ready = loop.create_future()
+
+        def on_ready():
+            if not ready.done():
+                ready.set_result(None)
+
+        try:
+            loop.add_reader(fd, on_ready)
+        except NotImplementedError:
+            # Event loops without add_reader (Windows proactor): block in the default executor
+            return await loop.run_in_executor(None, conn.recv)
+        try:
+            await ready
+        finally:
+            loop.remove_reader(fd)
+    # Replies are a few bytes and written in one go, once readable recv() doesn't block
+    return conn.recv()
+
+
+class AsyncEnvPool(object):
+    def __init__(self, num_envs, env_cls=BipedalWalker, num_workers=None, context=None):
+        self.pool = SubprocEnvPool(num_envs, env_cls, num_workers, context)
+        self.num_envs = num_envs
+
+    async def _gather(self):
+        # One reply per worker, in worker order
+        return [await _recv(conn) for conn in self.pool.conns]
+
+    async def seed(self, seed=None):
+        self.pool._send('seed', seed)
+        return [s for seeds in await self._gather() for s in seeds]
+
+    async def reset(self):
+        self.pool._send('reset')
+        await self._gather()
+        return self.pool.observations.copy()
+
+    def step_async(self, actions):
+        self.pool.step_async(actions)
+
+    async def step_wait(self):
+        return self.pool._finish_step(await self._gather())
+
+    async def step(self, actions):
+        self.step_async(actions)
+        return await self.step_wait()
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,148 @@
+import argparse
+import json
+import multiprocessing as mp
+import platform
+import sys
+import time
+
+import numpy as np
+
+from env_pool import SubprocEnvPool
+from vec_env import BipedalWalkerVec
+from walker import BipedalWalker, BipedalWalkerHardcore
+
+# Throughput benchmark for the simulator, written as JSON so runs can be compared release over
+# release: steps/sec and resets/sec for BipedalWalker and BipedalWalkerHardcore under a random
+# and a fixed policy, for a single env (with and without rgb_array rendering) and for batches
+# of envs in one process (BipedalWalkerVec) and across processes (SubprocEnvPool).
+#
+# python bench_env.py --steps 5000 --num-envs 16 --output bench.json
+
+ENVS = {'normal': BipedalWalker, 'hardcore': BipedalWalkerHardcore}
+FIXED_ACTION = np.array([0.5, -0.5, 0.5, -0.5])
+
+
+class NumpyRenderWalker(BipedalWalker):
+    render_backend = 'numpy'
+
+
+class NumpyRenderWalkerHardcore(BipedalWalkerHardcore):
+    render_backend = 'numpy'
+
+
+RENDER_ENVS = {'normal': NumpyRenderWalker, 'hardcore': NumpyRenderWalkerHardcore}
+
+
+def latency_stats(latencies, units_per_call=1):
+    latencies = np.asarray(latencies)
+    return {
+        'calls': len(latencies),
+        'per_sec': units_per_call * len(latencies) / latencies.sum(),
+        'latency_us': {
+            'mean': latencies.mean() * 1e6,
+            'p50': np.percentile(latencies, 50) * 1e6,
+            'p90': np.percentile(latencies, 90) * 1e6,
+            'p99': np.percentile(latencies, 99) * 1e6,
+            'max': latencies.max() * 1e6,
+        },
+    }
+
+
+def actions_for(policy, rng, shape):
+    if policy == 'random':
+        return rng.uniform(-1, 1, size=shape)
+    return np.broadcast_to(FIXED_ACTION, shape)
+
+
+def bench_single(env_cls, policy, steps, resets, seed, render):
+    env = env_cls()
+    env.seed(seed)
+    rng = np.random.RandomState(seed)
+
+    reset_latencies = []
+    for _ in range(resets):
+        t0 = time.perf_counter()
+        env.reset()
+        reset_latencies.append(time.perf_counter() - t0)
+
+    env.reset()
+    step_latencies = []
+    episodes = 0
+    for a in actions_for(policy, rng, (steps, 4)):
+        t0 = time.perf_counter()
+        _, _, done, _ = env.step(a)
+        if render:
+            env.render(mode='rgb_array')
+        step_latencies.append(time.perf_counter() - t0)
+        if done:
+            episodes += 1
+            env.reset()
+    env.close()
+    return {'step': latency_stats(step_latencies), 'reset': latency_stats(reset_latencies), 'episodes': episodes}
+
+
+def bench_batched(make, num_envs, policy, steps, seed):
+    envs = make()
+    envs.seed(seed)
+    rng = np.random.RandomState(seed)
+    envs.reset()
+    latencies = []
+    episodes = 0
+    for _ in range(max(1, steps // num_envs)):
+        actions = actions_for(policy, rng, (num_envs, 4))
+        t0 = time.perf_counter()
+        _, _, dones, _ = envs.step(actions)
+        latencies.append(time.perf_counter() - t0)
+        episodes += int(dones.sum())
+    envs.close()
+    # per_sec counts env steps, latency is per batched step call
+    return {'step': latency_stats(latencies, num_envs), 'episodes': episodes}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--steps', type=int, default=5000, help="env steps per configuration")
+    parser.add_argument('--resets', type=int, default=100)
+    parser.add_argument('--num-envs', type=int, default=16)
+    parser.add_argument('--num-workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="JSON file, default stdout")
+    args = parser.parse_args()
+
+    results = []
+    for name in ENVS:
+        for policy in ('random', 'fixed'):
+            for render in (False, True):
+                env_cls = RENDER_ENVS[name] if render else ENVS[name]
+                r = bench_single(env_cls, policy, args.steps, args.resets, args.seed, render)
+                r.update({'env': name, 'policy': policy, 'mode': 'single', 'num_envs': 1, 'render': render})
+                results.append(r)
+
+            r = bench_batched(lambda: BipedalWalkerVec(args.num_envs, ENVS[name]),
+                              args.num_envs, policy, args.steps, args.seed)
+            r.update({'env': name, 'policy': policy, 'mode': 'vec', 'num_envs': args.num_envs, 'render': False})
+            results.append(r)
+
+            r = bench_batched(lambda: SubprocEnvPool(args.num_envs, ENVS[name], num_workers=args.num_workers),
+                              args.num_envs, policy, args.steps, args.seed)
+            r.update({'env': name, 'policy': policy, 'mode': 'subproc', 'num_envs': args.num_envs, 'render': False})
+            results.append(r)
+            print("%-9s %-7s done" % (name, policy), file=sys.stderr)
+
+    report = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': {
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'cpu_count': mp.cpu_count(),
+        },
+        'settings': vars(args),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
@@ -0,0 +1,61 @@
+import argparse
+import time
+
+import numpy as np
+
+from walker import BipedalWalker, BipedalWalkerHardcore, FIDELITY_PROFILES
+
+# Steps/sec per physics fidelity profile, and how far episode returns drift from the 'reference'
+# profile when every profile replays the same seeds and the same action logs.
+#
+# python bench_fidelity.py --episodes 20 --steps 1600
+
+
+def run_episode(env, seed, actions):
+    env.seed(seed)
+    env.reset()
+    total_reward = 0.0
+    steps = 0
+    t0 = time.perf_counter()
+    for a in actions:
+        _, reward, done, _ = env.step(a)
+        total_reward += reward
+        steps += 1
+        if done:
+            break
+    return total_reward, steps, time.perf_counter() - t0
+
+
+def bench(env_cls, seeds, steps):
+    logs = [np.random.RandomState(seed).uniform(-1, 1, size=(steps, 4)) for seed in seeds]
+    results = {}
+    for profile in FIDELITY_PROFILES:
+        env = env_cls()
+        env.fidelity = profile
+        returns, total_steps, elapsed = [], 0, 0.0
+        for seed, actions in zip(seeds, logs):
+            total_reward, n, t = run_episode(env, seed, actions)
+            returns.append(total_reward)
+            total_steps += n
+            elapsed += t
+        env.close()
+        results[profile] = (np.array(returns), total_steps / elapsed)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--episodes', type=int, default=20)
+    parser.add_argument('--steps', type=int, default=1600)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    seeds = list(range(args.seed, args.seed + args.episodes))
+
+    print("%-22s %-10s %12s %14s %14s" % ("env", "profile", "steps/sec", "mean |drift|", "max |drift|"))
+    for env_cls in (BipedalWalker, BipedalWalkerHardcore):
+        results = bench(env_cls, seeds, args.steps)
+        reference = results['reference'][0]
+        for profile, (returns, steps_per_sec) in results.items():
+            drift = np.abs(returns - reference)
+            print("%-22s %-10s %12.0f %14.3f %14.3f" % (
+                env_cls.__name__, profile, steps_per_sec, drift.mean(), drift.max()))
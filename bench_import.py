@@ -0,0 +1,35 @@
+import argparse
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# Startup cost of the env modules: wall time of a fresh interpreter importing each module, minus
+# the time of an interpreter that imports nothing. This is what every spawned worker pays.
+#
+# python bench_import.py --repeat 10
+
+MODULES = ['numpy', 'Box2D', 'gym', 'walker', 'vec_env', 'env_pool']
+
+
+def time_command(code, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.check_call([sys.executable, '-c', code])
+        times.append(time.perf_counter() - t0)
+    return np.array(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('modules', nargs='*', default=MODULES)
+    args = parser.parse_args()
+
+    baseline = np.median(time_command('pass', args.repeat))
+    print("%-12s %12s %12s" % ("module", "median (ms)", "max (ms)"))
+    for module in args.modules:
+        times = time_command('import ' + module, args.repeat) - baseline
+        print("%-12s %12.1f %12.1f" % (module, np.median(times) * 1e3, times.max() * 1e3))
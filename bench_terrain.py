@@ -0,0 +1,53 @@
+import argparse
+import time
+
+import numpy as np
+
+from walker import BipedalWalker, BipedalWalkerHardcore
+
+# Reset and step timings with the ground built from TERRAIN_LENGTH - 1 edge bodies ("edges",
+# the old layout) versus one chain fixture ("chain"). Same seeds and action log for both.
+#
+# python bench_terrain.py --resets 200 --steps 5000
+
+
+def make_env(base, chain):
+    cls = type(base.__name__ + ('Chain' if chain else 'Edges'), (base,), {'chain_terrain': chain})
+    return cls()
+
+
+def bench(env, seed, resets, steps):
+    env.seed(seed)
+    t0 = time.perf_counter()
+    for _ in range(resets):
+        env.reset()
+    reset_time = (time.perf_counter() - t0) / resets
+
+    actions = np.random.RandomState(seed).uniform(-1, 1, size=(steps, 4))
+    env.seed(seed)
+    env.reset()
+    elapsed = 0.0
+    for a in actions:
+        t0 = time.perf_counter()
+        _, _, done, _ = env.step(a)
+        elapsed += time.perf_counter() - t0
+        if done:
+            env.reset()
+    return reset_time, elapsed / steps
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--resets', type=int, default=200)
+    parser.add_argument('--steps', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print("%-22s %-6s %12s %12s %12s" % ("env", "ground", "reset (ms)", "step (us)", "steps/sec"))
+    for base in (BipedalWalker, BipedalWalkerHardcore):
+        for chain in (False, True):
+            env = make_env(base, chain)
+            reset_time, step_time = bench(env, args.seed, args.resets, args.steps)
+            print("%-22s %-6s %12.3f %12.1f %12.0f" % (
+                base.__name__, "chain" if chain else "edges", reset_time * 1e3, step_time * 1e6, 1.0 / step_time))
+            env.close()
@@ -0,0 +1,155 @@
+import multiprocessing as mp
+
+import numpy as np
+
+from walker import BipedalWalker
+
+# Process pool hosting BipedalWalker / BipedalWalkerHardcore instances in worker processes.
+#
+# Box2D stepping and the lidar raycasts hold the GIL, so one process tops out on one core.
+# Here every worker owns a contiguous slice of the envs and writes observations, rewards and
+# done flags straight into shared-memory NumPy arrays; the pipes only carry short commands
+# and an acknowledgement, never (state, reward, done, info) tuples.
+#
+# Layout is the same as BipedalWalkerVec: (N, 24) observations, (N,) rewards and dones,
+# finished sub-envs are reset automatically and their last observation is kept in
+# terminal_observations (valid where dones is set).
+
+
+def _shared_array(typecode, shape, dtype):
+    raw = mp.RawArray(typecode, int(np.prod(shape)))
+    return raw, np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+
+def _worker(conn, env_cls, start, stop, raw_buffers, num_envs):
+    obs = np.frombuffer(raw_buffers['obs'], dtype=np.float32).reshape(num_envs, 24)
+    terminal_obs = np.frombuffer(raw_buffers['terminal_obs'], dtype=np.float32).reshape(num_envs, 24)
+    rewards = np.frombuffer(raw_buffers['rewards'], dtype=np.float32)
+    dones = np.frombuffer(raw_buffers['dones'], dtype=np.uint8)
+    actions = np.frombuffer(raw_buffers['actions'], dtype=np.float32).reshape(num_envs, 4)
+
+    envs = [env_cls() for _ in range(start, stop)]
+    try:
+        while True:
+            cmd, arg = conn.recv()
+            if cmd == 'step':
+                infos = []
+                for i, env in enumerate(envs, start):
+                    _, reward, done, info = env.step_into(actions[i], obs[i])
+                    if done:
+                        terminal_obs[i] = obs[i]
+                        obs[i] = env.reset()
+                    rewards[i] = reward
+                    dones[i] = done
+                    if info:
+                        infos.append((i, info))
+                # Usually an empty list, so the reply stays a few bytes
+                conn.send(infos)
+            elif cmd == 'reset':
+                for i, env in enumerate(envs, start):
+                    obs[i] = env.reset()
+                    dones[i] = 0
+                conn.send(None)
+            elif cmd == 'seed':
+                # Env i gets seed + i, matching BipedalWalkerVec.seed
+                seeds = []
+                for i, env in enumerate(envs, start):
+                    seeds += env.seed(None if arg is None else arg + i)
+                conn.send(seeds)
+            elif cmd == 'close':
+                break
+            else:
+                raise ValueError('unknown command %r' % (cmd,))
+    finally:
+        for env in envs:
+            env.close()
+        conn.close()
+
+
+class SubprocEnvPool(object):
+    def __init__(self, num_envs, env_cls=BipedalWalker, num_workers=None, context=None):
+        if num_workers is None:
+            num_workers = min(num_envs, mp.cpu_count())
+        num_workers = max(1, min(num_workers, num_envs))
+        ctx = mp.get_context(context)
+
+        self.num_envs = num_envs
+        self.num_workers = num_workers
+
+        raw_buffers = {}
+        raw_buffers['obs'], self.observations = _shared_array('f', (num_envs, 24), np.float32)
+        raw_buffers['terminal_obs'], self.terminal_observations = _shared_array('f', (num_envs, 24), np.float32)
+        raw_buffers['rewards'], self.rewards = _shared_array('f', (num_envs,), np.float32)
+        raw_buffers['dones'], self.dones = _shared_array('B', (num_envs,), np.uint8)
+        raw_buffers['actions'], self.actions = _shared_array('f', (num_envs, 4), np.float32)
+
+        # Split envs as evenly as possible, first workers take the remainder
+        base, extra = divmod(num_envs, num_workers)
+        bounds = np.cumsum([0] + [base + (w < extra) for w in range(num_workers)])
+        self.conns = []
+        self.processes = []
+        for w in range(num_workers):
+            parent_conn, child_conn = ctx.Pipe()
+            p = ctx.Process(target=_worker,
+                            args=(child_conn, env_cls, bounds[w], bounds[w + 1], raw_buffers, num_envs))
+            p.daemon = True
+            p.start()
+            child_conn.close()
+            self.conns.append(parent_conn)
+            self.processes.append(p)
+
+        self.waiting = False
+        self.closed = False
+
+    def _send(self, cmd, arg=None):
+        for conn in self.conns:
+            conn.send((cmd, arg))
+
+    def seed(self, seed=None):
+        self._send('seed', seed)
+        seeds = []
+        for conn in self.conns:
+            seeds += conn.recv()
+        return seeds
+
+    def reset(self):
+        self._send('reset')
+        for conn in self.conns:
+            conn.recv()
+        return self.observations.copy()
+
+    def step_async(self, actions):
+        assert not self.waiting
+        self.actions[:] = actions
+        self._send('step')
+        self.waiting = True
+
+    def step_wait(self):
+        return self._finish_step([conn.recv() for conn in self.conns])
+
+    def _finish_step(self, replies):
+        # replies: what every worker sent back for 'step', in worker order
+        infos = [{} for _ in range(self.num_envs)]
+        for reply in replies:
+            for i, info in reply:
+                infos[i] = info
+        self.waiting = False
+        dones = self.dones.astype(np.bool_)
+        for i in np.flatnonzero(dones):
+            infos[i] = dict(infos[i], terminal_observation=self.terminal_observations[i].copy())
+        return self.observations.copy(), self.rewards.copy(), dones, infos
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            for conn in self.conns:
+                conn.recv()
+        self._send('close')
+        for p in self.processes:
+            p.join()
+        self.closed = True
@@ -0,0 +1,65 @@
+import numpy as np
+
+# Analytic lidar: all rays are intersected at once against the terrain as a set of line segments,
+# no Box2D RayCast and no Python callback per fixture hit.
+#
+# Segments are the ground polyline (terrain_x, terrain_y) plus the outline of every hardcore
+# obstacle polygon (pits, stumps, stairs), stored as an (S, 4) array of x1, y1, x2, y2 sorted by
+# their left end so only the part of the course under the rays has to be tested.
+#
+# The Box2D path stops at the first fixture reported, which is the nearest one whenever a ray
+# only crosses one surface; here the nearest hit is always returned.
+
+
+class TerrainSegments(object):
+    def __init__(self, terrain_x, terrain_y, obstacles=()):
+        terrain_x = np.asarray(terrain_x, dtype=np.float64)
+        terrain_y = np.asarray(terrain_y, dtype=np.float64)
+        parts = [np.column_stack((terrain_x[:-1], terrain_y[:-1], terrain_x[1:], terrain_y[1:]))]
+        for poly in obstacles:
+            poly = np.asarray(poly, dtype=np.float64)
+            parts.append(np.hstack((poly, np.roll(poly, -1, axis=0))))
+        segments = np.concatenate(parts)
+
+        xmin = np.minimum(segments[:, 0], segments[:, 2])
+        order = np.argsort(xmin, kind='stable')
+        self.segments = segments[order]
+        self.xmin = xmin[order]
+        # Running max of the right ends: everything before searchsorted(reach, x) ends left of x
+        self.reach = np.maximum.accumulate(np.maximum(self.segments[:, 0], self.segments[:, 2]))
+
+    def window(self, x1, x2):
+        lo = np.searchsorted(self.reach, x1, side='left')
+        hi = np.searchsorted(self.xmin, x2, side='right')
+        return self.segments[lo:hi]
+
+    def raycast(self, p1, p2):
+        # p1, p2: (R, 2) ray start and end points. Returns (R,) hit fractions along p1 -> p2
+        # (1.0 where nothing is hit) and the (R, 2) hit points (p2 where nothing is hit).
+        p1 = np.asarray(p1, dtype=np.float64)
+        p2 = np.asarray(p2, dtype=np.float64)
+        xs = np.concatenate((p1[:, 0], p2[:, 0]))
+        segments = self.window(xs.min(), xs.max())
+        fractions = raycast_segments(p1, p2, segments)
+        points = p1 + fractions[:, None] * (p2 - p1)
+        return fractions, points
+
+
+def raycast_segments(p1, p2, segments):
+    # Nearest intersection of every ray p1[r] -> p2[r] with every segment, fully broadcast.
+    if len(segments) == 0:
+        return np.ones(len(p1))
+    r = (p2 - p1)[:, None, :]                      # (R, 1, 2)
+    a = segments[None, :, 0:2]                     # (1, S, 2)
+    s = segments[None, :, 2:4] - a                 # (1, S, 2)
+    d = a - p1[:, None, :]                         # (R, S, 2)
+
+    denom = r[..., 0] * s[..., 1] - r[..., 1] * s[..., 0]
+    t_num = d[..., 0] * s[..., 1] - d[..., 1] * s[..., 0]
+    u_num = d[..., 0] * r[..., 1] - d[..., 1] * r[..., 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = t_num / denom
+        u = u_num / denom
+    hit = (denom != 0) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+    t = np.where(hit, t, 1.0)
+    return t.min(axis=1)
@@ -0,0 +1,180 @@
+import numpy as np
+
+from walker import (
+    ROLE_HULL, ROLE_LOWER_LEG, SCALE, VIEWPORT_W, BipedalWalker, ContactDetector, LidarCallback
+)
+
+# num_walkers robots on one terrain in one Box2D world, all advanced by a single world.Step.
+# Walker bodies only collide with the ground (categoryBits 0x0020, maskBits 0x0001), so the
+# robots walk through each other; terrain construction and the broadphase are shared instead of
+# paid once per world as with BipedalWalkerVec.
+#
+# reset() returns (K, 24) observations, step() takes (K, 4) actions (a single (4,) action is
+# applied to every robot) and returns (K, 24) observations, (K,) rewards, (K,) dones and an
+# info dict. Each robot has its own contacts, lidar, reward shaping and termination; a robot
+# that is done gets zero reward from then on, its bodies are switched off and its observation
+# is frozen. The episode is over when dones.all(), then call reset().
+#
+# Every robot starts at the same spot, they only differ by the random push on the hull. The
+# view follows the robot furthest ahead. endless terrain, stall_window, clone_state(),
+# restore_state() and render_snapshot() are single-walker only.
+
+
+class _Walker(object):
+    def __init__(self, hull, legs, joints):
+        self.hull = hull
+        self.legs = legs
+        self.joints = joints
+        self.lidar = [LidarCallback() for _ in range(10)]
+        self.prev_shaping = None
+        self.game_over = False
+        self.done = False
+        self.torque = None
+
+
+class MultiContactDetector(ContactDetector):
+    # Hull userData index is the robot, leg index is the position in env.all_legs
+    def BeginContact(self, contact):
+        self.begin_count += 1
+        role_a, index_a = contact.fixtureA.body.userData
+        role_b, index_b = contact.fixtureB.body.userData
+        if role_a == ROLE_HULL:
+            self.env.walkers[index_a].game_over = True
+        if role_b == ROLE_HULL:
+            self.env.walkers[index_b].game_over = True
+        if role_a == ROLE_LOWER_LEG:
+            self.env.all_legs[index_a].ground_contact = True
+        if role_b == ROLE_LOWER_LEG:
+            self.env.all_legs[index_b].ground_contact = True
+
+    def EndContact(self, contact):
+        self.end_count += 1
+        role_a, index_a = contact.fixtureA.body.userData
+        role_b, index_b = contact.fixtureB.body.userData
+        if role_a == ROLE_LOWER_LEG:
+            self.env.all_legs[index_a].ground_contact = False
+        if role_b == ROLE_LOWER_LEG:
+            self.env.all_legs[index_b].ground_contact = False
+
+
+class MultiBipedalWalker(BipedalWalker):
+    contact_detector_class = MultiContactDetector
+
+    num_walkers = 4
+
+    def __init__(self):
+        self.walkers = []
+        self.all_legs = []
+        BipedalWalker.__init__(self)
+
+    def _select(self, walker):
+        # Points the single-walker state BipedalWalker's step helpers use at one robot
+        self.hull = walker.hull
+        self.legs = walker.legs
+        self.joints = walker.joints
+        self.lidar = walker.lidar
+        self.prev_shaping = walker.prev_shaping
+        self.game_over = walker.game_over
+
+    def _create_walkers(self, init_x, init_y):
+        self.all_legs = []
+        self.walkers = []
+        for k in range(self.num_walkers):
+            joints = []
+            hull = self._create_walker(init_x, init_y, k, self.all_legs, joints)
+            self.walkers.append(_Walker(hull, self.all_legs[4 * k:4 * k + 4], joints))
+        self._select(self.walkers[0])
+        self.obs_buffer = np.zeros((self.num_walkers, 24), dtype=np.float32)
+        # Last observation of every robot, copied into out for the ones that are done
+        self.last_obs = np.zeros((self.num_walkers, 24), dtype=np.float32)
+        self.rewards = np.zeros(self.num_walkers)
+        self.dones = np.zeros(self.num_walkers, dtype=np.bool_)
+
+    def _destroy_walker(self):
+        if not self.walkers: return
+        self.world.contactListener = None
+        for walker in self.walkers:
+            self.world.DestroyBody(walker.hull)
+            for leg in walker.legs:
+                self.world.DestroyBody(leg)
+        self.walkers = []
+        self.all_legs = []
+        self.hull = None
+        self.legs = []
+        self.joints = []
+
+    def _reset(self):
+        if self.endless:
+            raise ValueError("endless terrain is not supported with several walkers")
+        if self.stall_window:
+            raise ValueError("stall_window is not supported with several walkers")
+        return BipedalWalker._reset(self)
+
+    def _step(self, action):
+        state = np.empty((self.num_walkers, 24))
+        _, rewards, dones, info = self.step_into(action, state)
+        return state, rewards, dones, info
+
+    def step_into(self, actions, out=None):
+        # Same as step(), observations are written into out, shape (num_walkers, 24)
+        if out is None:
+            out = self.obs_buffer
+        actions = np.broadcast_to(actions, (self.num_walkers, 4))
+        walkers = self.walkers
+        for walker, action in zip(walkers, actions):
+            if walker.done: continue
+            self._select(walker)
+            walker.torque = self._apply_action(action)
+
+        rewards = self.rewards
+        rewards[:] = 0
+        for _ in range(self.frame_skip):
+            self._world_step()
+            alive = False
+            for k, walker in enumerate(walkers):
+                if walker.done: continue
+                self._select(walker)
+                reward, done = self._tick_reward(walker.torque)
+                walker.prev_shaping = self.prev_shaping
+                rewards[k] += reward
+                if done:
+                    walker.done = True
+                    # Out of the broadphase and the solver, and no longer hit by lidar
+                    for body in [walker.hull] + walker.legs:
+                        body.active = False
+                else:
+                    alive = True
+            if not alive:
+                break
+
+        lead = None
+        for k, walker in enumerate(walkers):
+            if self.dones[k]:
+                out[k] = self.last_obs[k]
+                continue
+            self._select(walker)
+            pos = walker.hull.position
+            self._cast_lidar(pos)
+            self._observe(out[k])
+            self.last_obs[k] = out[k]
+            self.dones[k] = walker.done
+            if lead is None or pos.x > lead:
+                lead = pos.x
+        self._select(walkers[0])
+
+        if lead is not None:
+            self.scroll = lead - VIEWPORT_W / SCALE / 5
+        return out, rewards.copy(), self.dones.copy(), {}
+
+    def _draw_walkers(self, viewer):
+        for walker in self.walkers:
+            self._draw_bodies(viewer, walker.legs + [walker.hull])
+
+    def clone_state(self):
+        raise ValueError("clone_state() is not supported with several walkers")
+
+    def restore_state(self, snapshot):
+        raise ValueError("restore_state() is not supported with several walkers")
+
+    def render_snapshot(self, out=None):
+        raise ValueError("render_snapshot() is not supported with several walkers")
@@ -0,0 +1,50 @@
+from time import perf_counter
+
+# Opt-in per-phase timing for BipedalWalker: set env.timers = PhaseTimers() and step/reset as
+# usual, then print(env.timers) or env.timers.dump(). Leaving env.timers at None costs one
+# attribute check per phase.
+#
+# Reset phases: 'destroy' (previous episode's bodies), 'terrain' (terrain and cloud data, from the
+# generator, a library, a prefetch or the cache), 'terrain_bodies' (Box2D ground and obstacle
+# bodies) and 'bodies' (the walker).
+
+PHASES = ('action', 'world_step', 'reward', 'lidar', 'observation', 'destroy', 'terrain', 'terrain_bodies',
+          'bodies')
+
+
+class PhaseTimers(object):
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.totals = dict.fromkeys(PHASES, 0.0)
+        self.calls = dict.fromkeys(PHASES, 0)
+
+    @staticmethod
+    def start():
+        return perf_counter()
+
+    def mark(self, phase, t0):
+        # Charges the time since t0 to phase and returns the current time as the next t0
+        t = perf_counter()
+        self.totals[phase] += t - t0
+        self.calls[phase] += 1
+        return t
+
+    def dump(self):
+        return {
+            phase: {
+                'calls': self.calls[phase],
+                'total_sec': self.totals[phase],
+                'mean_us': self.totals[phase] / self.calls[phase] * 1e6 if self.calls[phase] else 0.0,
+            }
+            for phase in PHASES
+        }
+
+    def __str__(self):
+        total = sum(self.totals.values()) or 1.0
+        lines = ["%-12s %10s %12s %10s %7s" % ("phase", "calls", "total (s)", "mean (us)", "share")]
+        for phase, stats in self.dump().items():
+            lines.append("%-12s %10d %12.4f %10.1f %6.1f%%" % (
+                phase, stats['calls'], stats['total_sec'], stats['mean_us'], 100.0 * stats['total_sec'] / total))
+        return "\n".join(lines)
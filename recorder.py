@@ -0,0 +1,153 @@
+import json
+import os
+
+import numpy as np
+
+# Streams walker transitions to disk as memory-mapped columns, one raw file per column, so very
+# long runs can be kept and read back zero-copy with np.memmap.
+#
+# Row t of the transition columns holds the observation the action was taken in, the action,
+# and the reward and done flag step() returned for it. Files grow by chunk_size rows at a time;
+# index.json records the row counts, dtypes and shapes and is rewritten on flush() and close().
+#
+#     recorder = TrajectoryRecorder(env, 'runs/0001')
+#     obs = recorder.reset()
+#     while ...:
+#         obs, reward, done, info = recorder.step(policy(obs))
+#         if done:
+#             obs = recorder.reset()
+#     recorder.close()
+#
+#     data = load_trajectories('runs/0001')
+#     start, end = episode_bounds(data, 3)
+#     data['observations'][start:end]
+
+TRANSITION_COLUMNS = [
+    ('observations', np.float32, (24,)),
+    ('actions', np.float32, (4,)),
+    ('rewards', np.float32, ()),
+    ('dones', np.uint8, ()),
+]
+EPISODE_COLUMNS = [
+    ('episode_starts', np.int64, ()),
+    ('episode_seeds', np.uint64, ()),
+]
+
+
+class _Column(object):
+    def __init__(self, path, dtype, shape, chunk_size):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.shape = shape
+        self.chunk_size = chunk_size
+        self.row_bytes = self.dtype.itemsize * int(np.prod(shape))
+        self.count = 0
+        self.capacity = 0
+        self.array = None
+        open(path, 'wb').close()
+        self._grow()
+
+    def _grow(self):
+        if self.array is not None:
+            self.array.flush()
+            self.array = None
+        self.capacity += self.chunk_size
+        with open(self.path, 'r+b') as f:
+            f.truncate(self.capacity * self.row_bytes)
+        self.array = np.memmap(self.path, dtype=self.dtype, mode='r+', shape=(self.capacity,) + self.shape)
+
+    def append(self, value):
+        if self.count == self.capacity:
+            self._grow()
+        self.array[self.count] = value
+        self.count += 1
+
+    def flush(self):
+        self.array.flush()
+
+    def close(self):
+        self.array.flush()
+        self.array = None
+        # Drop the unused tail of the last chunk
+        with open(self.path, 'r+b') as f:
+            f.truncate(self.count * self.row_bytes)
+
+
+class TrajectoryRecorder(object):
+    def __init__(self, env, directory, chunk_size=1 << 16):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        if os.path.exists(os.path.join(directory, 'index.json')):
+            raise ValueError("%s already holds a recording" % directory)
+        self.env = env
+        self.directory = directory
+        self.columns = {}
+        for name, dtype, shape in TRANSITION_COLUMNS + EPISODE_COLUMNS:
+            self.columns[name] = _Column(os.path.join(directory, name + '.bin'), dtype, shape, chunk_size)
+        self.obs = np.zeros(24, dtype=np.float32)
+        self.closed = False
+
+    def reset(self, seed=None):
+        # The env is reseeded every episode so the episode can be replayed from (seed, actions)
+        seed = self.env.seed(seed)[0]
+        self.columns['episode_starts'].append(self.columns['observations'].count)
+        self.columns['episode_seeds'].append(seed)
+        self.obs[:] = self.env.reset()
+        return self.obs
+
+    def step(self, action):
+        self.columns['observations'].append(self.obs)
+        self.columns['actions'].append(action)
+        _, reward, done, info = self.env.step_into(action, self.obs)
+        self.columns['rewards'].append(reward)
+        self.columns['dones'].append(done)
+        return self.obs, reward, done, info
+
+    def _write_index(self):
+        index = {
+            'transitions': self.columns['observations'].count,
+            'episodes': self.columns['episode_starts'].count,
+            'columns': {
+                name: {'dtype': np.dtype(dtype).str, 'shape': list(shape)}
+                for name, dtype, shape in TRANSITION_COLUMNS + EPISODE_COLUMNS
+            },
+        }
+        tmp = os.path.join(self.directory, 'index.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp, os.path.join(self.directory, 'index.json'))
+
+    def flush(self):
+        for column in self.columns.values():
+            column.flush()
+        self._write_index()
+
+    def close(self):
+        if self.closed:
+            return
+        for column in self.columns.values():
+            column.close()
+        self._write_index()
+        self.closed = True
+
+
+def load_trajectories(directory):
+    # Read-only memmaps of every column, trimmed to the rows recorded at the last flush
+    with open(os.path.join(directory, 'index.json')) as f:
+        index = json.load(f)
+    data = {}
+    for name, column in index['columns'].items():
+        rows = index['episodes'] if name.startswith('episode_') else index['transitions']
+        shape = (rows,) + tuple(column['shape'])
+        if rows == 0:
+            data[name] = np.zeros(shape, dtype=column['dtype'])
+            continue
+        data[name] = np.memmap(os.path.join(directory, name + '.bin'), dtype=column['dtype'], mode='r', shape=shape)
+    return data
+
+
+def episode_bounds(data, k):
+    # Row range [start, end) of episode k in the transition columns
+    starts = data['episode_starts']
+    end = starts[k + 1] if k + 1 < len(starts) else len(data['observations'])
+    return int(starts[k]), int(end)
@@ -0,0 +1,154 @@
+import bisect
+import math
+import multiprocessing as mp
+import queue
+import time
+
+import numpy as np
+
+from walker import (
+    GROUND_COLOR, OBSTACLE_COLORS, RENDER_SNAPSHOT_SIZE, SCALE, VIEWPORT_H, VIEWPORT_W, WALKER_SHAPES,
+    draw_clouds, draw_flag, draw_ground_fill, draw_lidar, draw_outlined, draw_sky, ground_polys, lidar_beam
+)
+
+# Watch a walker live without making the training loop wait for drawing.
+#
+# The env side only calls publish(env) after each step: it writes the env's render_snapshot()
+# (walker poses, scroll, lidar end points) into a small shared-memory ring and, once per new
+# terrain, sends the static terrain and clouds over a queue. A separate process draws the latest
+# complete frame at its own frame rate and silently skips the ones it was too slow to show.
+#
+#     viewer = RenderProcess(fps=30)
+#     ...
+#     env.step(a)
+#     viewer.publish(env)
+#     ...
+#     viewer.close()
+
+# Ring slot: sequence number (-1 while being written), episode id, render snapshot
+FRAME_SIZE = 2 + RENDER_SNAPSHOT_SIZE
+
+
+class RenderProcess(object):
+    def __init__(self, fps=30, slots=4, context=None):
+        ctx = mp.get_context(context)
+        self.slots = slots
+        self.raw = ctx.RawArray('d', slots * FRAME_SIZE)
+        self.ring = np.frombuffer(self.raw, dtype=np.float64).reshape(slots, FRAME_SIZE)
+        self.counter = ctx.RawValue('q', 0)
+        self.static_queue = ctx.Queue()
+        self.stop_event = ctx.Event()
+        self.episode = 0
+        self.terrain = None
+
+        self.process = ctx.Process(target=_render_loop,
+                                   args=(self.raw, self.counter, slots, self.static_queue, self.stop_event, fps))
+        self.process.daemon = True
+        self.process.start()
+
+    def publish(self, env):
+        if env.terrain is not self.terrain:
+            self.terrain = env.terrain
+            self.episode += 1
+            # Nobody reads the queue once the viewer died (e.g. no display), stop feeding it
+            if self.process.is_alive():
+                self.static_queue.put((self.episode, {
+                    'terrain_x': np.asarray(env.terrain_x),
+                    'terrain_y': np.asarray(env.terrain_y),
+                    'obstacles': env.terrain_obstacles,
+                    'clouds': sorted(env.cloud_poly, key=lambda c: c[1]),
+                }))
+        n = self.counter.value + 1
+        slot = self.ring[n % self.slots]
+        slot[0] = -1
+        slot[1] = self.episode
+        env.render_snapshot(out=slot[2:])
+        slot[0] = n
+        self.counter.value = n
+
+    def close(self):
+        self.stop_event.set()
+        self.process.join()
+        # Terrain still buffered for a viewer that never read it must not block interpreter exit
+        self.static_queue.cancel_join_thread()
+        self.static_queue.close()
+
+
+def _read_latest(ring, counter, slots, last):
+    n = counter.value
+    if n == last:
+        return n, None
+    slot = ring[n % slots]
+    frame = slot.copy()
+    # Writer lapped the ring while we copied, try again next tick
+    if frame[0] != n or slot[0] != n:
+        return last, None
+    return n, frame
+
+
+def _transform(vertices, x, y, angle):
+    c, s = math.cos(angle), math.sin(angle)
+    return [(x + c * vx - s * vy, y + s * vx + c * vy) for vx, vy in vertices]
+
+
+def _draw(viewer, static, snapshot, lidar_render):
+    # Same drawing steps as BipedalWalker._render, fed from the snapshot and the static terrain
+    scroll = snapshot[15]
+    right = scroll + VIEWPORT_W / SCALE
+    viewer.set_bounds(scroll, right, 0, VIEWPORT_H / SCALE)
+    draw_sky(viewer, scroll)
+    draw_clouds(viewer, static['clouds'], scroll)
+
+    terrain_x, terrain_y = static['terrain_x'], static['terrain_y']
+    lo = max(bisect.bisect_left(terrain_x, scroll) - 1, 0)
+    hi = bisect.bisect_right(terrain_x, right) + 1
+    draw_ground_fill(viewer, static['ground'][lo:hi - 1], scroll)
+
+    i = lidar_beam(lidar_render)
+    if i is not None:
+        draw_lidar(viewer, (snapshot[16], snapshot[17]), (snapshot[18 + 2 * i], snapshot[19 + 2 * i]))
+
+    viewer.draw_polyline(list(zip(terrain_x[lo:hi], terrain_y[lo:hi])), color=GROUND_COLOR, linewidth=2)
+    for poly in static['obstacles']:
+        if poly[1][0] < scroll or poly[0][0] > right: continue
+        draw_outlined(viewer, poly, *OBSTACLE_COLORS)
+
+    # Same order as the env draws them: legs, then the hull on top
+    for k in [1, 2, 3, 4, 0]:
+        vertices, color1, color2 = WALKER_SHAPES[k]
+        draw_outlined(viewer, _transform(vertices, snapshot[3 * k], snapshot[3 * k + 1], snapshot[3 * k + 2]),
+                      color1, color2)
+
+    draw_flag(viewer)
+
+
+def _render_loop(raw, counter, slots, static_queue, stop_event, fps):
+    from gym.envs.classic_control import rendering
+    ring = np.frombuffer(raw, dtype=np.float64).reshape(slots, FRAME_SIZE)
+    viewer = rendering.Viewer(VIEWPORT_W, VIEWPORT_H)
+    episodes = {}
+    last = 0
+    lidar_render = 0
+    try:
+        while not stop_event.is_set():
+            t0 = time.time()
+            while True:
+                try:
+                    episode, static = static_queue.get_nowait()
+                except queue.Empty:
+                    break
+                static['ground'] = ground_polys(static['terrain_x'], static['terrain_y'])
+                episodes[episode] = static
+
+            last, frame = _read_latest(ring, counter, slots, last)
+            if frame is not None and int(frame[1]) in episodes:
+                episode = int(frame[1])
+                for old in [e for e in episodes if e < episode]:
+                    del episodes[old]
+                lidar_render = (lidar_render + 1) % 100
+                _draw(viewer, episodes[episode], frame[2:], lidar_render)
+                viewer.render()
+
+            time.sleep(max(0.0, 1.0 / fps - (time.time() - t0)))
+    finally:
+        viewer.close()
@@ -0,0 +1,113 @@
+import argparse
+import time
+
+import numpy as np
+
+from recorder import episode_bounds, load_trajectories
+from walker import BipedalWalker, BipedalWalkerHardcore
+
+# Re-runs recorded episodes from their seed and action log and checks that observations and
+# rewards come out the same, bit for bit by default or within --atol. Also reports steps/sec,
+# so the same recording doubles as a fixed timing workload.
+#
+# Record with the reference settings, then replay with the setting under test:
+#
+# python replay.py runs/0001 --episodes 0 1 2
+# python replay.py runs/0001 --lidar-engine numpy --atol 1e-5
+# python replay.py actions.npy --seed 3 --hardcore          (timing only, nothing to compare)
+#
+# The replaying env has to build the same terrain as the recording one: same hardcore flag and
+# terrain mode (terrain_library, endless and prefetch_terrain all change what a seed produces).
+# --persistent-terrain is the exception, episodes started right after seed() get the same terrain
+# and initial push as with per-episode terrain, and the recorder reseeds every episode.
+
+
+def replay_episode(env, seed, actions, observations=None, rewards=None, atol=0.0):
+    # observations[t] is the observation actions[t] was taken in (recorder layout), compared in
+    # float32 because that is how they are recorded
+    env.seed(seed)
+    obs = np.empty(24, dtype=np.float32)
+    obs[:] = env.reset()
+    obs_error = reward_error = 0.0
+    first_mismatch = None
+    steps = 0
+    elapsed = 0.0
+    for t, action in enumerate(actions):
+        if observations is not None:
+            error = float(np.abs(obs - observations[t]).max())
+            obs_error = max(obs_error, error)
+            if error > atol and first_mismatch is None:
+                first_mismatch = t
+        t0 = time.perf_counter()
+        _, reward, done, _ = env.step_into(action, obs)
+        elapsed += time.perf_counter() - t0
+        steps += 1
+        if rewards is not None:
+            error = abs(float(np.float32(reward)) - float(rewards[t]))
+            reward_error = max(reward_error, error)
+            if error > atol and first_mismatch is None:
+                first_mismatch = t
+        if done:
+            break
+    return {
+        'steps': steps,
+        'steps_per_sec': steps / elapsed if elapsed > 0 else float('inf'),
+        'max_obs_error': obs_error,
+        'max_reward_error': reward_error,
+        'first_mismatch': first_mismatch,
+        'ended_early': steps < len(actions),
+    }
+
+
+def make_env(args):
+    env = (BipedalWalkerHardcore if args.hardcore else BipedalWalker)()
+    env.fidelity = args.fidelity
+    env.lidar_engine = args.lidar_engine
+    env.persistent_terrain = args.persistent_terrain
+    return env
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('source', help="recorder directory, or a .npy (T, 4) action log")
+    parser.add_argument('--episodes', type=int, nargs='*', help="episodes of the recording, default all")
+    parser.add_argument('--seed', type=int, help="seed for a .npy action log")
+    parser.add_argument('--hardcore', action='store_true')
+    parser.add_argument('--atol', type=float, default=0.0)
+    parser.add_argument('--fidelity', default='reference')
+    parser.add_argument('--lidar-engine', default='box2d')
+    parser.add_argument('--persistent-terrain', action='store_true',
+                        help="replay on cached terrain, matches recordings made with or without it")
+    args = parser.parse_args()
+
+    env = make_env(args)
+    runs = []
+    if args.source.endswith('.npy'):
+        if args.seed is None:
+            parser.error("--seed is required with a .npy action log")
+        runs.append(('-', args.seed, np.load(args.source), None, None))
+    else:
+        data = load_trajectories(args.source)
+        episodes = args.episodes if args.episodes else range(len(data['episode_starts']))
+        for k in episodes:
+            start, end = episode_bounds(data, k)
+            runs.append((k, int(data['episode_seeds'][k]), data['actions'][start:end],
+                         data['observations'][start:end], data['rewards'][start:end]))
+
+    failed = 0
+    print("%-8s %8s %12s %14s %14s %10s" % ("episode", "steps", "steps/sec", "obs error", "reward error", "result"))
+    for k, seed, actions, observations, rewards in runs:
+        result = replay_episode(env, seed, actions, observations, rewards, args.atol)
+        if observations is None:
+            status = "-"
+        elif result['first_mismatch'] is not None or result['ended_early']:
+            status = "MISMATCH" if result['first_mismatch'] is not None else "SHORT"
+            failed += 1
+        else:
+            status = "ok"
+        print("%-8s %8d %12.0f %14.3g %14.3g %10s" % (
+            k, result['steps'], result['steps_per_sec'], result['max_obs_error'], result['max_reward_error'], status))
+        if result['first_mismatch'] is not None:
+            print("         first mismatch at step %d" % result['first_mismatch'])
+    env.close()
+    raise SystemExit(1 if failed else 0)
@@ -0,0 +1,39 @@
+import numpy as np
+
+# Fixed-size experience replay for train.py: transitions (state, action index, reward, next
+# state, done) go into preallocated NumPy columns, the oldest are overwritten once capacity is
+# reached, and minibatches are drawn uniformly with one fancy-index per column.
+#
+#     memory = ReplayMemory(100000)
+#     memory.add(state, action, reward, next_state, done)
+#     states, actions, rewards, next_states, dones = memory.sample(64)
+
+
+class ReplayMemory(object):
+    def __init__(self, capacity, state_size=24):
+        self.capacity = capacity
+        self.states = np.zeros((capacity, state_size), dtype=np.float32)
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_states = np.zeros((capacity, state_size), dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=np.float32)
+        self.size = 0
+        self.next_index = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, state, action, reward, next_state, done):
+        i = self.next_index
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        self.dones[i] = done
+        self.next_index = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def sample(self, batch_size, np_random=np.random):
+        # Uniform with replacement; dones come back as 0.0 / 1.0 so they can scale the bootstrap term
+        idx = np_random.randint(0, self.size, size=batch_size)
+        return self.states[idx], self.actions[idx], self.rewards[idx], self.next_states[idx], self.dones[idx]
@@ -0,0 +1,84 @@
+import numpy as np
+
+# Pure NumPy rasterizer with the subset of gym's rendering.Viewer API that BipedalWalker uses
+# (set_bounds, draw_polygon, draw_polyline, render), for rgb_array frames on machines without
+# a display or OpenGL. Everything is drawn into one reusable (height, width, 3) uint8 buffer.
+
+
+class SoftwareRenderer(object):
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.frame = np.zeros((height, width, 3), dtype=np.uint8)
+        self.set_bounds(0, width, 0, height)
+
+    def set_bounds(self, left, right, bottom, top):
+        self.scale_x = self.width / float(right - left)
+        self.scale_y = self.height / float(top - bottom)
+        self.left = left
+        self.bottom = bottom
+
+    def _to_pixels(self, points):
+        # World coordinates to pixel coordinates, y pointing down like the rows of the frame
+        v = np.array([(p[0], p[1]) for p in points], dtype=np.float64)
+        v[:, 0] = (v[:, 0] - self.left) * self.scale_x
+        v[:, 1] = self.height - (v[:, 1] - self.bottom) * self.scale_y
+        return v
+
+    @staticmethod
+    def _color(color):
+        return np.array([int(c * 255) for c in color[:3]], dtype=np.uint8)
+
+    def draw_polygon(self, v, color=(0, 0, 0)):
+        v = self._to_pixels(v)
+        color = self._color(color)
+        x0 = max(int(np.floor(v[:, 0].min())), 0)
+        x1 = min(int(np.ceil(v[:, 0].max())), self.width)
+        y0 = max(int(np.floor(v[:, 1].min())), 0)
+        y1 = min(int(np.ceil(v[:, 1].max())), self.height)
+        if x0 >= x1 or y0 >= y1:
+            return
+
+        # Axis-aligned rectangles (the sky) are a plain slice fill
+        if len(v) == 4 and len(np.unique(v[:, 0])) == 2 and len(np.unique(v[:, 1])) == 2:
+            self.frame[y0:y1, x0:x1] = color
+            return
+
+        # Even-odd rule on pixel centers inside the bounding box, one pass per edge
+        px = np.arange(x0, x1) + 0.5
+        py = (np.arange(y0, y1) + 0.5)[:, None]
+        inside = np.zeros((y1 - y0, x1 - x0), dtype=np.bool_)
+        for (ax, ay), (bx, by) in zip(v, np.roll(v, -1, axis=0)):
+            if ay == by:
+                continue
+            crosses = (ay > py) != (by > py)
+            x_at_y = ax + (py - ay) * (bx - ax) / (by - ay)
+            inside ^= crosses & (px < x_at_y)
+        self.frame[y0:y1, x0:x1][inside] = color
+
+    def draw_polyline(self, v, color=(0, 0, 0), linewidth=1):
+        v = self._to_pixels(v)
+        color = self._color(color)
+        half = max(linewidth, 1) / 2.0
+        points = []
+        for a, b in zip(v[:-1], v[1:]):
+            n = int(np.ceil(np.abs(b - a).max() * 2)) + 1
+            points.append(a + np.linspace(0, 1, n)[:, None] * (b - a))
+        if not points:
+            return
+        points = np.concatenate(points)
+        # Stamp a linewidth x linewidth square at every sample along the line
+        offsets = np.arange(int(np.floor(-half + 0.5)), int(np.floor(half + 0.5)))
+        xs = (np.floor(points[:, 0])[:, None] + offsets).astype(np.int64)
+        ys = (np.floor(points[:, 1])[:, None] + offsets).astype(np.int64)
+        xs = np.broadcast_to(xs[:, None, :], (len(points), len(offsets), len(offsets))).ravel()
+        ys = np.broadcast_to(ys[:, :, None], (len(points), len(offsets), len(offsets))).ravel()
+        keep = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        self.frame[ys[keep], xs[keep]] = color
+
+    def render(self, return_rgb_array=True):
+        # The returned array is the frame buffer itself and is overwritten by the next frame
+        return self.frame
+
+    def close(self):
+        pass
@@ -0,0 +1,127 @@
+import argparse
+import json
+import struct
+
+import numpy as np
+
+from walker import PIT, STAIRS, STUMP, TERRAIN_LENGTH, TERRAIN_STEP, generate_terrain
+
+# Library of pre-generated terrains in one memory-mapped file, so envs skip the per-reset
+# generation loop and thousands of workers can share the same pages through the OS cache.
+#
+# File layout: 8-byte magic, 8-byte header length, JSON header (hardcore flag, seed and, per
+# array, dtype, shape and offset), then the arrays at 64-byte aligned offsets:
+#
+#   heights           (T, TERRAIN_LENGTH) terrain_y of every terrain
+#   obstacle_offsets  (T + 1,)            terrain k owns obstacles[offsets[k]:offsets[k + 1]]
+#   obstacles         (M, 4, 2)           pit, stump and stair polygons
+#   stats             (T, 5)              pits, stumps, stairs, roughness, difficulty
+#   by_difficulty     (T,)                terrain ids sorted by difficulty
+#
+# Build with:
+#
+# python terrain_library.py terrains.bin --count 10000 --hardcore
+#
+# and use it in an env:
+#
+#     env.terrain_library = TerrainLibrary('terrains.bin')
+#     env.terrain_id = 42               # this terrain on every reset, or
+#     env.terrain_difficulty = 0.3      # a terrain around the 30th difficulty percentile
+
+MAGIC = b'BWTERR01'
+ALIGN = 64
+STAT_NAMES = ['pits', 'stumps', 'stairs', 'roughness', 'difficulty']
+
+
+def terrain_stats(terrain_y, kinds):
+    # A pit is two polygons, a flight of stairs one polygon per step
+    kinds = np.asarray(kinds, dtype=np.int64)
+    pits = np.count_nonzero(kinds == PIT) // 2
+    stumps = np.count_nonzero(kinds == STUMP)
+    stair_steps = np.count_nonzero(kinds == STAIRS)
+    roughness = np.abs(np.diff(terrain_y)).mean() / TERRAIN_STEP
+    difficulty = pits + stumps + 0.5 * stair_steps + 10.0 * roughness
+    return pits, stumps, stair_steps, roughness, difficulty
+
+
+def build_library(path, count, hardcore, seed=0):
+    heights = np.empty((count, TERRAIN_LENGTH))
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    stats = np.empty((count, len(STAT_NAMES)), dtype=np.float32)
+    obstacles = []
+    for k in range(count):
+        kinds = []
+        _, heights[k], polys = generate_terrain(np.random.RandomState(seed + k), hardcore, kinds)
+        obstacles += polys
+        offsets[k + 1] = len(obstacles)
+        stats[k] = terrain_stats(heights[k], kinds)
+    arrays = {
+        'heights': heights,
+        'obstacle_offsets': offsets,
+        'obstacles': np.array(obstacles, dtype=np.float64).reshape(-1, 4, 2),
+        'stats': stats,
+        'by_difficulty': np.argsort(stats[:, 4], kind='stable').astype(np.int64),
+    }
+
+    header = {'hardcore': bool(hardcore), 'seed': seed, 'count': count, 'stats': STAT_NAMES, 'arrays': {}}
+    # Header size depends on the offsets it contains, so lay out with a generous fixed budget
+    offset = ALIGN * ((16 + 4096 + ALIGN - 1) // ALIGN)
+    for name, a in arrays.items():
+        header['arrays'][name] = {'dtype': a.dtype.str, 'shape': list(a.shape), 'offset': offset}
+        offset += ALIGN * ((a.nbytes + ALIGN - 1) // ALIGN)
+    header_bytes = json.dumps(header).encode('utf-8')
+    assert 16 + len(header_bytes) <= header['arrays']['heights']['offset']
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for name, a in arrays.items():
+            f.seek(header['arrays'][name]['offset'])
+            f.write(np.ascontiguousarray(a).tobytes())
+        f.truncate(offset)
+
+
+class TerrainLibrary(object):
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            if f.read(8) != MAGIC:
+                raise ValueError("%s is not a terrain library" % path)
+            length, = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(length).decode('utf-8'))
+        self.path = path
+        self.hardcore = header['hardcore']
+        self.count = header['count']
+        for name, spec in header['arrays'].items():
+            setattr(self, name, np.memmap(path, dtype=spec['dtype'], mode='r',
+                                          offset=spec['offset'], shape=tuple(spec['shape'])))
+        self.terrain_x = np.arange(TERRAIN_LENGTH) * TERRAIN_STEP
+
+    def __len__(self):
+        return self.count
+
+    def terrain(self, k):
+        # Same (terrain_x, terrain_y, obstacles) triple generate_terrain returns
+        polys = self.obstacles[self.obstacle_offsets[k]:self.obstacle_offsets[k + 1]]
+        return self.terrain_x, np.array(self.heights[k]), [[tuple(p) for p in poly] for poly in polys.tolist()]
+
+    def sample(self, np_random, difficulty, width=0.1):
+        # Uniform pick among the terrains whose difficulty rank lies within width / 2 of the
+        # difficulty quantile (0 easiest, 1 hardest); constant time, no search
+        lo = int(np.clip(difficulty - width / 2, 0, 1) * (self.count - 1))
+        hi = int(np.clip(difficulty + width / 2, 0, 1) * (self.count - 1)) + 1
+        return int(self.by_difficulty[np_random.randint(lo, hi)])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path')
+    parser.add_argument('--count', type=int, default=10000)
+    parser.add_argument('--hardcore', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    build_library(args.path, args.count, args.hardcore, args.seed)
+    library = TerrainLibrary(args.path)
+    stats = np.asarray(library.stats)
+    for i, name in enumerate(STAT_NAMES):
+        print("%-10s min %8.3f  mean %8.3f  max %8.3f" % (name, stats[:, i].min(), stats[:, i].mean(), stats[:, i].max()))
@@ -0,0 +1,158 @@
+import argparse
+import random
+
+import numpy as np
+
+from keras.models import Sequential
+from keras.layers import Dense, Dropout
+from keras.optimizers import SGD
+
+from render_process import RenderProcess
+from replay_memory import ReplayMemory
+from walker import BipedalWalker
+
+# Keras training loop for the walker, run with:
+#
+# python train.py
+#
+# and with --viewer to watch the walker in a separate render process (needs a display).
+
+
+def get_power(a):
+    if a == -0.1:
+        return 1
+    if a == 0:
+        return 0
+    return 2
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--viewer', action='store_true', help="draw the walker live in a render process")
+    args = parser.parse_args()
+
+    # #site-ul sursa: https://www.tensorflow.org/get_started/mnist/pros
+    #
+    # #added some code to evaluate the way we will implement the neuronal network
+    # #we have to decide how and in which way will we implement it
+    # sess = tf.InteractiveSession()
+    # W = tf.Variable(tf.zeros([24, 4]))
+    # #s are 24 de campuri si ar trebui sa aiba 4 output-uri
+    # b = tf.Variable(tf.zeros([4]))
+    # y = tf.nn.softmax(tf.matmul(x, W) + b)#pentru iteratii
+    # sess.run(tf.global_variables_initializer())
+    #
+    # #cross_entropy = tf.reduce_mean(-tf.reduce_sum(y_ * tf.log(y), reduction_indices=[1]))
+    # cross_entropy = tf.reduce_mean(
+    #     tf.nn.softmax_cross_entropy_with_logits(labels=y_, logits=y))
+    # train_step = tf.train.AdamOptimizer(1e-4).minimize(cross_entropy)
+    #
+    # #iteratii
+    # train_step = tf.train.GradientDescentOptimizer(0.5).minimize(cross_entropy)
+    # correct_prediction = tf.equal(tf.argmax(y, 1), tf.argmax(y_, 1)) #aici trebuie implementata functia de activare
+    # accuracy = tf.reduce_mean(tf.cast(correct_prediction, tf.float32))
+
+    env = BipedalWalker()
+    env.reset()
+    viewer = RenderProcess() if args.viewer else None
+    steps = 0
+
+    random.seed(12345)
+    model = Sequential()
+    model.add(Dense(0.2, input_shape=(24,)))
+    model.add(Dense(30, input_shape=(24,), activation='sigmoid'))
+    # One unbounded Q value per move, regressed onto the replay targets below
+    model.add(Dense(81, activation='linear'))
+
+    optimizer = SGD(lr=0.05, momentum=0.8)
+
+    model.compile(optimizer=optimizer, loss='mse')
+
+    last_state = np.zeros(24)
+    last_move_index = 0
+    discount_factor = 0.5
+    possible_moves = [-0.1, 0, 0.1]
+    # Index of the move that adds 0 to every joint
+    no_move_index = 40
+
+    # One batched update every train_every steps on a minibatch drawn from the replay memory,
+    # target for the taken move is r + discount_factor * max Q(next state), 0 bootstrap when done
+    memory = ReplayMemory(100000)
+    batch_size = 64
+    train_every = 4
+    total_steps = 0
+
+    # functie de clip pentru valori -1 -> 1 (sau -0.1 -> 0.1)
+    # functie de explorare, ca sa nu ia chiar intotdeauna cea mai buna solutie
+    # acesta functie de explorare sa aiba o probabilitate mai mica cu cat au trecut mai multe iteratii
+    # dupa ce a invatat destul aplicam algoritmul de Q-learning care invata si updateaza ultimii 100 de pasi pe formula
+    #                                           scrisa pe caiet
+    # alte chestii de care am uitat, in principiu optimizari presupun
+    try:
+        for i in range(0, 100):
+            total_reward = 0
+            last_state = env.reset()
+            last_move_index = no_move_index
+            a = np.array([0.0, 0.0, 0.0, 0.0])
+            steps = 0
+            while True:
+                current_state, current_reward, done, info = env.step(a)
+                total_reward += current_reward
+                if steps % 100 == 0:
+                    print("Current Reward" + str(current_reward))
+                    print("Total Reward"+str(total_reward))
+                steps += 1
+                if steps == 100:
+                    done = True
+                    current_reward = -1000
+
+                memory.add(last_state, last_move_index, current_reward, current_state, done)
+                total_steps += 1
+                if total_steps % train_every == 0 and len(memory) >= batch_size:
+                    states, actions, rewards, next_states, dones = memory.sample(batch_size)
+                    # Q values of the states and the next states in a single predict call
+                    q = model.predict(np.concatenate((states, next_states)), batch_size=2 * batch_size)
+                    targets = q[:batch_size]
+                    next_q = q[batch_size:].max(axis=1)
+                    targets[np.arange(batch_size), actions] = rewards + discount_factor * next_q * (1 - dones)
+                    model.train_on_batch(states, targets)
+
+                best_score = -2018
+                best_index = 0
+                state = list(current_state)
+
+                random_move = random.randrange(0, 100)
+                if random_move > 10:
+                    score = model.predict(np.array([state]), batch_size=1)
+                    for x in range(0, 81):
+                        if score[0][x] > best_score:
+                            best_score = score[0][x]
+                            best_index = x
+                else:
+                    random_move = random.randrange(0, 81)
+                    best_index = random_move
+
+                a = np.array([a[0], a[1], a[2], a[3]])
+                move_index = best_index
+                for i in reversed(range(0, 4)):
+                    power = pow(3, i)
+                    aux = move_index // power
+                    a[i] += possible_moves[aux]
+
+                    if a[i] > 1:
+                        a[i] = 1
+                    if a[i] < -1:
+                        a[i] = -1
+
+                    move_index = move_index - power * (move_index // power)
+
+                last_move_index = best_index
+                last_state = state
+
+                if viewer is not None:
+                    viewer.publish(env)
+                if done:
+                    break
+    finally:
+        if viewer is not None:
+            viewer.close()
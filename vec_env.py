@@ -0,0 +1,58 @@
+import numpy as np
+
+from walker import BipedalWalker
+
+# Batched wrapper around N independent BipedalWalker instances, each with its own Box2D world.
+#
+# reset() returns a (N, 24) observation array, step(actions) takes a (N, 4) action array and
+# returns (N, 24) observations, (N,) rewards, (N,) dones and a list of N info dicts.
+#
+# Finished sub-envs are reset automatically inside step(): the observation returned for them is
+# the first observation of the new episode, the last observation of the finished one is kept in
+# info['terminal_observation'].
+
+
+class BipedalWalkerVec(object):
+    def __init__(self, num_envs, env_cls=BipedalWalker):
+        self.num_envs = num_envs
+        self.envs = [env_cls() for _ in range(num_envs)]
+        self.action_space = self.envs[0].action_space
+        self.observation_space = self.envs[0].observation_space
+
+        self.observations = np.zeros((num_envs, 24), dtype=np.float32)
+        self.rewards = np.zeros(num_envs, dtype=np.float32)
+        self.dones = np.zeros(num_envs, dtype=np.bool_)
+
+    def seed(self, seed=None):
+        # Sub-env i gets seed + i, so a single seed reproduces the whole batch
+        seeds = []
+        for i, env in enumerate(self.envs):
+            seeds += env.seed(None if seed is None else seed + i)
+        return seeds
+
+    def reset(self):
+        for i, env in enumerate(self.envs):
+            self.observations[i] = env.reset()
+        self.dones[:] = False
+        return self.observations.copy()
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        assert actions.shape == (self.num_envs, 4)
+        infos = []
+        for i, env in enumerate(self.envs):
+            _, reward, done, info = env.step_into(actions[i], self.observations[i])
+            if done:
+                info = dict(info, terminal_observation=self.observations[i].copy())
+                self.observations[i] = env.reset()
+            self.rewards[i] = reward
+            self.dones[i] = done
+            infos.append(info)
+        return self.observations.copy(), self.rewards.copy(), self.dones.copy(), infos
+
+    def render(self, index=0, mode='human'):
+        return self.envs[index].render(mode=mode)
+
+    def close(self):
+        for env in self.envs:
+            env.close()
@@ -1,18 +1,19 @@
+import bisect
 import math
-import random
+import os
+from collections import OrderedDict
 
 import numpy as np
 
-from keras.models import Sequential
-from keras.layers import Dense, Dropout
-from keras.optimizers import SGD
-
 import Box2D
-from Box2D.b2 import edgeShape, circleShape, fixtureDef, polygonShape, revoluteJointDef, contactListener
+from Box2D.b2 import edgeShape, chainShape, circleShape, fixtureDef, polygonShape, revoluteJointDef, contactListener
 import gym
 from gym import spaces
 from gym.utils import colorize, seeding
 
+from lidar import TerrainSegments
+from software_render import SoftwareRenderer
+
 # This is simple 4-joints walker robot environment.
 #
 # There are two versions:
@@ -40,7 +41,9 @@ from gym.utils import colorize, seeding
 # To solve hardcore version you need 300 points in 2000 time steps.
 #
 # Created by Oleg Klimov. Licensed on the same terms as the rest of OpenAI Gym.
-from keras.utils import to_categorical
+#
+# This module only needs Box2D, NumPy and gym so it imports fast in worker processes; gym's
+# pyglet rendering is imported on the first human render. The Keras training loop is train.py.
 
 FPS = 50
 SCALE = 30.0  # affects how fast-paced the game is, forces should be adjusted as well
@@ -49,6 +52,8 @@ MOTORS_TORQUE = 80
 SPEED_HIP = 4
 SPEED_KNEE = 6
 LIDAR_RANGE = 160 / SCALE
+LIDAR_OFFSETS = np.array([
+    (math.sin(1.5 * i / 10.0) * LIDAR_RANGE, -math.cos(1.5 * i / 10.0) * LIDAR_RANGE) for i in range(10)])
 
 INITIAL_RANDOM = 5
 
@@ -69,23 +74,308 @@ TERRAIN_GRASS = 10  # low long are grass spots, in steps
 TERRAIN_STARTPAD = 20  # in steps
 FRICTION = 2.5
 
+# Terrain generator states, also the obstacle kinds reported by generate_terrain
+GRASS, STUMP, STAIRS, PIT, _STATES_ = range(5)
+
+# Physics fidelity profiles: (substeps per env step, velocity iterations, position iterations).
+# 'reference' is the original solver setting, 'fast' uses Box2D's default iteration counts.
+FIDELITY_PROFILES = {
+    'reference': (1, 6 * 30, 2 * 30),
+    'fast': (1, 8, 3),
+    'fastest': (1, 4, 2),
+}
+
+
+class TerrainGenerator(object):
+    # Terrain heights and obstacle polygons (pits, stumps, stairs), no Box2D bodies involved.
+    # Resumable: next(n) continues the walk for n more points, so the course can be generated in
+    # chunks, and any split of TERRAIN_LENGTH points gives the same terrain as one call.
+    # The height walk stays a sequential loop: RNG draws are interleaved with the state machine,
+    # and drawing them in one batch would change the terrain produced by a given seed.
+    def __init__(self, np_random, hardcore):
+        self.np_random = np_random
+        self.hardcore = hardcore
+        self.i = 0
+        self.state = GRASS
+        self.velocity = 0.0
+        self.y = TERRAIN_HEIGHT
+        self.counter = TERRAIN_STARTPAD
+        self.oneshot = False
+        self.original_y = self.stair_height = self.stair_width = self.stair_steps = None
+
+    def next(self, n, kinds=None):
+        # Next n points as (terrain_x, terrain_y, obstacles). If kinds is a list, the state (PIT,
+        # STUMP or STAIRS) of every obstacle is appended to it. Obstacles start at one of the n
+        # points but can reach up to a few dozen steps beyond the last one.
+        np_random, hardcore = self.np_random, self.hardcore
+        state, velocity, y, counter, oneshot = self.state, self.velocity, self.y, self.counter, self.oneshot
+        original_y, stair_height = self.original_y, self.stair_height
+        stair_width, stair_steps = self.stair_width, self.stair_steps
+        terrain_x = np.arange(self.i, self.i + n) * TERRAIN_STEP
+        terrain_y = np.empty(n)
+        obstacles = []
+        for k in range(n):
+            i = self.i + k
+            x = terrain_x[k]
+
+            if state == GRASS and not oneshot:
+                velocity = 0.8 * velocity + 0.01 * ((y < TERRAIN_HEIGHT) - (y > TERRAIN_HEIGHT))
+                if i > TERRAIN_STARTPAD: velocity += np_random.uniform(-1, 1) / SCALE  # 1
+                y += velocity
+
+            elif state == PIT and oneshot:
+                counter = np_random.randint(3, 5)
+                poly = [
+                    (x, y),
+                    (x + TERRAIN_STEP, y),
+                    (x + TERRAIN_STEP, y - 4 * TERRAIN_STEP),
+                    (x, y - 4 * TERRAIN_STEP),
+                ]
+                obstacles.append(poly)
+                obstacles.append([(p[0] + TERRAIN_STEP * counter, p[1]) for p in poly])
+                if kinds is not None: kinds += [PIT, PIT]
+                counter += 2
+                original_y = y
+
+            elif state == PIT and not oneshot:
+                y = original_y
+                if counter > 1:
+                    y -= 4 * TERRAIN_STEP
+
+            elif state == STUMP and oneshot:
+                counter = np_random.randint(1, 3)
+                poly = [
+                    (x, y),
+                    (x + counter * TERRAIN_STEP, y),
+                    (x + counter * TERRAIN_STEP, y + counter * TERRAIN_STEP),
+                    (x, y + counter * TERRAIN_STEP),
+                ]
+                obstacles.append(poly)
+                if kinds is not None: kinds.append(STUMP)
+
+            elif state == STAIRS and oneshot:
+                stair_height = +1 if np_random.rand() > 0.5 else -1
+                stair_width = np_random.randint(4, 5)
+                stair_steps = np_random.randint(3, 5)
+                original_y = y
+                for s in range(stair_steps):
+                    poly = [
+                        (x + (s * stair_width) * TERRAIN_STEP, y + (s * stair_height) * TERRAIN_STEP),
+                        (x + ((1 + s) * stair_width) * TERRAIN_STEP, y + (s * stair_height) * TERRAIN_STEP),
+                        (x + ((1 + s) * stair_width) * TERRAIN_STEP, y + (-1 + s * stair_height) * TERRAIN_STEP),
+                        (x + (s * stair_width) * TERRAIN_STEP, y + (-1 + s * stair_height) * TERRAIN_STEP),
+                    ]
+                    obstacles.append(poly)
+                    if kinds is not None: kinds.append(STAIRS)
+                counter = stair_steps * stair_width
+
+            elif state == STAIRS and not oneshot:
+                s = stair_steps * stair_width - counter - stair_height
+                n = s / stair_width
+                y = original_y + (n * stair_height) * TERRAIN_STEP
+
+            oneshot = False
+            terrain_y[k] = y
+            counter -= 1
+            if counter == 0:
+                counter = np_random.randint(TERRAIN_GRASS / 2, TERRAIN_GRASS)
+                if state == GRASS and hardcore:
+                    state = np_random.randint(1, _STATES_)
+                    oneshot = True
+                else:
+                    state = GRASS
+                    oneshot = True
+
+        self.i += len(terrain_x)
+        self.state, self.velocity, self.y, self.counter, self.oneshot = state, velocity, y, counter, oneshot
+        self.original_y, self.stair_height = original_y, stair_height
+        self.stair_width, self.stair_steps = stair_width, stair_steps
+        return terrain_x, terrain_y, obstacles
+
+
+def generate_terrain(np_random, hardcore, kinds=None):
+    # The whole TERRAIN_LENGTH course in one go, see TerrainGenerator
+    return TerrainGenerator(np_random, hardcore).next(TERRAIN_LENGTH, kinds)
+
+
+def make_cloud(np_random, x):
+    # Sorry for the clouds, couldn't resist
+    y = VIEWPORT_H / SCALE * 3 / 4
+    poly = [
+        (x + 15 * TERRAIN_STEP * math.sin(3.14 * 2 * a / 5) + np_random.uniform(0, 5 * TERRAIN_STEP),
+         y + 5 * TERRAIN_STEP * math.cos(3.14 * 2 * a / 5) + np_random.uniform(0, 5 * TERRAIN_STEP))
+        for a in range(5)]
+    x1 = min([p[0] for p in poly])
+    x2 = max([p[0] for p in poly])
+    return poly, x1, x2
+
+
+def generate_clouds(np_random):
+    return [make_cloud(np_random, np_random.uniform(0, TERRAIN_LENGTH) * TERRAIN_STEP)
+            for _ in range(TERRAIN_LENGTH // 20)]
+
+
+def _prefetch_job(seed, hardcore):
+    np_random = np.random.RandomState(seed)
+    terrain_x, terrain_y, obstacles = generate_terrain(np_random, hardcore)
+    return terrain_x, terrain_y, obstacles, generate_clouds(np_random)
+
+
+_prefetch_executor = None
+_prefetch_pid = None
+
+
+def _prefetch(seed, hardcore):
+    # One background thread per process is shared by all envs; concurrent.futures is only
+    # imported once some env prefetches. A forked child (env_pool workers) inherits the executor
+    # but not its thread, so each process starts its own
+    global _prefetch_executor, _prefetch_pid
+    if _prefetch_executor is None or _prefetch_pid != os.getpid():
+        from concurrent.futures import ThreadPoolExecutor
+        _prefetch_executor = ThreadPoolExecutor(max_workers=1)
+        _prefetch_pid = os.getpid()
+    return _prefetch_executor.submit(_prefetch_job, seed, hardcore)
+
+
+# Body geometry and colors, shared by the Box2D bodies and by every viewer drawing them
+# (BipedalWalker._render and render_process.py)
+HULL_VERTICES = [(x / SCALE, y / SCALE) for x, y in HULL_POLY]
+HULL_COLORS = ((0.5, 0.4, 0.9), (0.3, 0.3, 0.5))
+LEG_BOX = (LEG_W / 2, LEG_H / 2)
+LOWER_LEG_BOX = (0.8 * LEG_W / 2, LEG_H / 2)
+OBSTACLE_COLORS = ((1, 1, 1), (0.6, 0.6, 0.6))
+GROUND_COLOR = (0.3, 1.0, 0.3)
+GROUND_FILL_COLOR = (0.4, 0.6, 0.3)
+
+
+def leg_colors(i):
+    # Fill and outline of the upper and lower leg on side i (-1 or +1)
+    return (0.6 - i / 10., 0.3 - i / 10., 0.5 - i / 10.), (0.4 - i / 10., 0.2 - i / 10., 0.3 - i / 10.)
+
+
+def box_vertices(half_width, half_height):
+    # Corners of polygonShape(box=(half_width, half_height)), in Box2D's order
+    return [(-half_width, -half_height), (half_width, -half_height),
+            (half_width, half_height), (-half_width, half_height)]
+
+
+# Walker bodies in env order ([hull] + legs) as (local vertices, color1, color2)
+WALKER_SHAPES = [(HULL_VERTICES,) + HULL_COLORS] + [
+    (box_vertices(*box),) + leg_colors(i) for i in [-1, +1] for box in [LEG_BOX, LOWER_LEG_BOX]]
+
+
+def ground_polys(terrain_x, terrain_y):
+    # Filled strip under every ground segment, as drawn by draw_ground_fill
+    points = np.column_stack((terrain_x, terrain_y)).tolist()
+    return [([(x1, y1), (x2, y2), (x2, 0), (x1, 0)], GROUND_FILL_COLOR)
+            for (x1, y1), (x2, y2) in zip(points[:-1], points[1:])]
+
+
+# Drawing steps of a frame, in order, against anything with the Viewer drawing API
+
+def draw_sky(viewer, scroll):
+    right = scroll + VIEWPORT_W / SCALE
+    viewer.draw_polygon([(scroll, 0), (right, 0), (right, VIEWPORT_H / SCALE), (scroll, VIEWPORT_H / SCALE)],
+                        color=(0.9, 0.9, 1.0))
+
+
+def draw_clouds(viewer, clouds, scroll):
+    # clouds: (poly, x1, x2) items, they scroll at half speed
+    left = scroll / 2
+    for poly, x1, x2 in clouds:
+        if x2 < left or x1 > left + VIEWPORT_W / SCALE: continue
+        viewer.draw_polygon([(p[0] + left, p[1]) for p in poly], color=(1, 1, 1))
+
+
+def draw_ground_fill(viewer, polys, scroll):
+    # polys: ground_polys items, sorted by x
+    for poly, color in polys:
+        if poly[1][0] < scroll: continue
+        viewer.draw_polygon(poly, color=color)
+
+
+def lidar_beam(lidar_render):
+    # Index of the lidar ray shown at animation frame lidar_render (0..99), or None: the beam
+    # sweeps out over the ten rays and back, then stays off for the rest of the cycle
+    if lidar_render < 10:
+        return lidar_render
+    if lidar_render < 20:
+        return 19 - lidar_render
+    return None
+
+
+def draw_lidar(viewer, p1, p2):
+    viewer.draw_polyline([p1, p2], color=(1, 0, 0), linewidth=1)
+
+
+def draw_outlined(viewer, path, color1, color2):
+    viewer.draw_polygon(path, color=color1)
+    viewer.draw_polyline(list(path) + [path[0]], color=color2, linewidth=2)
+
+
+def draw_flag(viewer):
+    flagy1 = TERRAIN_HEIGHT
+    flagy2 = flagy1 + 50 / SCALE
+    x = TERRAIN_STEP * 3
+    viewer.draw_polyline([(x, flagy1), (x, flagy2)], color=(0, 0, 0), linewidth=2)
+    f = [(x, flagy2), (x, flagy2 - 10 / SCALE), (x + 25 / SCALE, flagy2 - 5 / SCALE)]
+    draw_outlined(viewer, f, (0.9, 0.2, 0), (0, 0, 0))
+
+
+# Per-frame render snapshot (see render_snapshot): x, y, angle of the hull and the four legs,
+# scroll, lidar start point and the ten lidar end points
+RENDER_SNAPSHOT_SIZE = 5 * 3 + 1 + 2 + 10 * 2
+
+# Body roles, every body gets (role, index) as userData so contacts are classified without
+# comparing against the env's bodies; index is the position in env.legs for legs, 0 otherwise
+ROLE_TERRAIN, ROLE_HULL, ROLE_LEG, ROLE_LOWER_LEG = range(4)
+
+
+def _visible_range(x1s, max_width, left, right):
+    # Slice of items sorted by left edge x1 that can overlap [left, right], given their widest width
+    return bisect.bisect_left(x1s, left - max_width), bisect.bisect_right(x1s, right)
+
 
 class ContactDetector(contactListener):
     def __init__(self, env):
         contactListener.__init__(self)
         self.env = env
+        # Contact events seen so far, for profiling
+        self.begin_count = 0
+        self.end_count = 0
+
+    def reset_counters(self):
+        self.begin_count = 0
+        self.end_count = 0
 
     def BeginContact(self, contact):
-        if self.env.hull == contact.fixtureA.body or self.env.hull == contact.fixtureB.body:
+        self.begin_count += 1
+        role_a, index_a = contact.fixtureA.body.userData
+        role_b, index_b = contact.fixtureB.body.userData
+        if role_a == ROLE_HULL or role_b == ROLE_HULL:
             self.env.game_over = True
-        for leg in [self.env.legs[1], self.env.legs[3]]:
-            if leg in [contact.fixtureA.body, contact.fixtureB.body]:
-                leg.ground_contact = True
+        if role_a == ROLE_LOWER_LEG:
+            self.env.legs[index_a].ground_contact = True
+        if role_b == ROLE_LOWER_LEG:
+            self.env.legs[index_b].ground_contact = True
 
     def EndContact(self, contact):
-        for leg in [self.env.legs[1], self.env.legs[3]]:
-            if leg in [contact.fixtureA.body, contact.fixtureB.body]:
-                leg.ground_contact = False
+        self.end_count += 1
+        role_a, index_a = contact.fixtureA.body.userData
+        role_b, index_b = contact.fixtureB.body.userData
+        if role_a == ROLE_LOWER_LEG:
+            self.env.legs[index_a].ground_contact = False
+        if role_b == ROLE_LOWER_LEG:
+            self.env.legs[index_b].ground_contact = False
+
+
+class LidarCallback(Box2D.b2.rayCastCallback):
+    def ReportFixture(self, fixture, point, normal, fraction):
+        if (fixture.filterData.categoryBits & 1) == 0:
+            return 1
+        self.p2 = point
+        self.fraction = fraction
+        return 0
 
 
 class BipedalWalker(gym.Env):
@@ -96,15 +386,78 @@ class BipedalWalker(gym.Env):
 
     hardcore = False
 
+    # Listener the world reports contacts to, built with the env as its only argument
+    contact_detector_class = ContactDetector
+
+    # Keep terrain bodies in the world across resets instead of rebuilding them every episode.
+    # Terrain is generated from the last seed passed to seed() (not from the episode RNG), so it
+    # only changes when the env is reseeded; up to terrain_cache_size terrains are kept in the
+    # world, inactive ones are switched off so they don't take part in collisions or raycasts.
+    persistent_terrain = False
+    terrain_cache_size = 8
+
+    # Build the ground surface as a single chain fixture instead of TERRAIN_LENGTH - 1 edge bodies
+    chain_terrain = True
+
+    # 'box2d' casts every lidar ray through world.RayCast, 'numpy' intersects all rays at once
+    # against the terrain segments (see lidar.py)
+    lidar_engine = 'box2d'
+
+    # Key of FIDELITY_PROFILES used by world.Step, train on a cheap one and validate on 'reference'
+    fidelity = 'reference'
+
+    # Physics ticks per step(): the action is repeated frame_skip times and rewards are summed
+    frame_skip = 1
+
+    # PhaseTimers instance to accumulate per-phase step/reset timings into, None disables timing
+    timers = None
+
+    # 'numpy' draws rgb_array frames with the headless SoftwareRenderer instead of a pyglet Viewer,
+    # mode='human' always goes through pyglet
+    render_backend = 'pyglet'
+
+    # TerrainLibrary to load terrain from instead of generating it on reset. terrain_id pins one
+    # terrain, otherwise terrain_difficulty (0 easiest to 1 hardest) samples around that
+    # difficulty quantile, and with neither set any terrain of the library is drawn uniformly.
+    # The terrain used is left in terrain_index.
+    terrain_library = None
+    terrain_id = None
+    terrain_difficulty = None
+
+    # Endless course: terrain is generated endless_chunk steps at a time ahead of the hull and
+    # chunks that scrolled out of view behind it are destroyed, so the live bodies, terrain arrays
+    # and clouds stay bounded however far the walker gets. Episodes only end by falling (wrap the
+    # env in a TimeLimit). persistent_terrain and terrain_library don't apply, and clone_state() /
+    # restore_state() raise, the streamed chunks and generator state are not part of a snapshot.
+    endless = False
+    endless_chunk = 50
+
+    # Generate the next episode's terrain and clouds on a background thread while the current one
+    # runs, leaving only body creation to reset(). The generator holds the GIL, so this moves the
+    # work off reset's latency rather than making it free.
+    prefetch_terrain = False
+
+    # End the episode once the hull has moved forward less than stall_min_progress (world units)
+    # over the last stall_window steps, with info['stalled'] = True and no extra penalty.
+    # None disables the check; changes take effect on the next reset.
+    stall_window = None
+    stall_min_progress = 1.0
+
     def __init__(self):
+        self.terrain_cache = OrderedDict()
+        self.contact_detector = self.contact_detector_class(self)
         self._seed()
         self.viewer = None
+        self.software_viewer = None
 
         self.world = Box2D.b2World()
         self.terrain = None
+        self.terrain_index = None
         self.hull = None
 
         self.prev_shaping = None
+        self.obs_buffer = np.zeros(24, dtype=np.float32)
+        self.action_buffer = np.zeros(4)
         self._reset()
 
         high = np.array([np.inf] * 24)
@@ -113,14 +466,31 @@ class BipedalWalker(gym.Env):
 
     def _seed(self, seed=None):
         self.np_random, seed = seeding.np_random(seed)
+        self.terrain_seed = seed
+        # A pending terrain prefetch was seeded from the previous RNG
+        self.terrain_future = None
+        # No reset has drawn from np_random yet
+        self.fresh_seed = True
         return [seed]
 
     def _destroy(self):
         if not self.terrain: return
         self.world.contactListener = None
-        for t in self.terrain:
-            self.world.DestroyBody(t)
+        if self.terrain_cache:
+            # Current terrain is one of the cached ones
+            for entry in self.terrain_cache.values():
+                for t in entry[0]:
+                    self.world.DestroyBody(t)
+            self.terrain_cache.clear()
+        else:
+            for t in self.terrain:
+                self.world.DestroyBody(t)
         self.terrain = []
+        self._destroy_walker()
+
+    def _destroy_walker(self):
+        if not self.hull: return
+        self.world.contactListener = None
         self.world.DestroyBody(self.hull)
         self.hull = None
         for leg in self.legs:
@@ -128,192 +498,222 @@ class BipedalWalker(gym.Env):
         self.legs = []
         self.joints = []
 
-    def _generate_terrain(self, hardcore):
-        GRASS, STUMP, STAIRS, PIT, _STATES_ = range(5)
-        state = GRASS
-        velocity = 0.0
-        y = TERRAIN_HEIGHT
-        counter = TERRAIN_STARTPAD
-        oneshot = False
-        self.terrain = []
-        self.terrain_x = []
-        self.terrain_y = []
-        for i in range(TERRAIN_LENGTH):
-            x = i * TERRAIN_STEP
-            self.terrain_x.append(x)
-
-            if state == GRASS and not oneshot:
-                velocity = 0.8 * velocity + 0.01 * np.sign(TERRAIN_HEIGHT - y)
-                if i > TERRAIN_STARTPAD: velocity += self.np_random.uniform(-1, 1) / SCALE  # 1
-                y += velocity
-
-            elif state == PIT and oneshot:
-                counter = self.np_random.randint(3, 5)
-                poly = [
-                    (x, y),
-                    (x + TERRAIN_STEP, y),
-                    (x + TERRAIN_STEP, y - 4 * TERRAIN_STEP),
-                    (x, y - 4 * TERRAIN_STEP),
-                ]
-                t = self.world.CreateStaticBody(
-                    fixtures=fixtureDef(
-                        shape=polygonShape(vertices=poly),
-                        friction=FRICTION
-                    ))
-                t.color1, t.color2 = (1, 1, 1), (0.6, 0.6, 0.6)
-                self.terrain.append(t)
-                t = self.world.CreateStaticBody(
-                    fixtures=fixtureDef(
-                        shape=polygonShape(vertices=[(p[0] + TERRAIN_STEP * counter, p[1]) for p in poly]),
-                        friction=FRICTION
-                    ))
-                t.color1, t.color2 = (1, 1, 1), (0.6, 0.6, 0.6)
-                self.terrain.append(t)
-                counter += 2
-                original_y = y
-
-            elif state == PIT and not oneshot:
-                y = original_y
-                if counter > 1:
-                    y -= 4 * TERRAIN_STEP
-
-            elif state == STUMP and oneshot:
-                counter = self.np_random.randint(1, 3)
-                poly = [
-                    (x, y),
-                    (x + counter * TERRAIN_STEP, y),
-                    (x + counter * TERRAIN_STEP, y + counter * TERRAIN_STEP),
-                    (x, y + counter * TERRAIN_STEP),
-                ]
-                t = self.world.CreateStaticBody(
-                    fixtures=fixtureDef(
-                        shape=polygonShape(vertices=poly),
-                        friction=FRICTION
-                    ))
-                t.color1, t.color2 = (1, 1, 1), (0.6, 0.6, 0.6)
-                self.terrain.append(t)
-
-            elif state == STAIRS and oneshot:
-                stair_height = +1 if self.np_random.rand() > 0.5 else -1
-                stair_width = self.np_random.randint(4, 5)
-                stair_steps = self.np_random.randint(3, 5)
-                original_y = y
-                for s in range(stair_steps):
-                    poly = [
-                        (x + (s * stair_width) * TERRAIN_STEP, y + (s * stair_height) * TERRAIN_STEP),
-                        (x + ((1 + s) * stair_width) * TERRAIN_STEP, y + (s * stair_height) * TERRAIN_STEP),
-                        (x + ((1 + s) * stair_width) * TERRAIN_STEP, y + (-1 + s * stair_height) * TERRAIN_STEP),
-                        (x + (s * stair_width) * TERRAIN_STEP, y + (-1 + s * stair_height) * TERRAIN_STEP),
-                    ]
-                    t = self.world.CreateStaticBody(
-                        fixtures=fixtureDef(
-                            shape=polygonShape(vertices=poly),
-                            friction=FRICTION
-                        ))
-                    t.color1, t.color2 = (1, 1, 1), (0.6, 0.6, 0.6)
-                    self.terrain.append(t)
-                counter = stair_steps * stair_width
+    def _generate_terrain(self, hardcore, np_random=None):
+        if np_random is None:
+            np_random = self.np_random
+        library = self.terrain_library
+        if library is None:
+            self.terrain_index = None
+            self.terrain_x, self.terrain_y, self.terrain_obstacles = generate_terrain(np_random, hardcore)
+        else:
+            if library.hardcore != hardcore:
+                raise ValueError("terrain library %s was built with hardcore=%s, env has hardcore=%s"
+                                 % (library.path, library.hardcore, hardcore))
+            if self.terrain_id is not None:
+                self.terrain_index = self.terrain_id
+            elif self.terrain_difficulty is not None:
+                self.terrain_index = library.sample(np_random, self.terrain_difficulty)
+            else:
+                self.terrain_index = np_random.randint(len(library))
+            self.terrain_x, self.terrain_y, self.terrain_obstacles = library.terrain(self.terrain_index)
 
-            elif state == STAIRS and not oneshot:
-                s = stair_steps * stair_width - counter - stair_height
-                n = s / stair_width
-                y = original_y + (n * stair_height) * TERRAIN_STEP
+    def _create_terrain_bodies(self):
+        self.terrain = self._terrain_bodies(self.terrain_x, self.terrain_y, self.terrain_obstacles)
+        self.terrain_poly = ground_polys(self.terrain_x, self.terrain_y)
 
-            oneshot = False
-            self.terrain_y.append(y)
-            counter -= 1
-            if counter == 0:
-                counter = self.np_random.randint(TERRAIN_GRASS / 2, TERRAIN_GRASS)
-                if state == GRASS and hardcore:
-                    state = self.np_random.randint(1, _STATES_)
-                    oneshot = True
-                else:
-                    state = GRASS
-                    oneshot = True
+    def _terrain_bodies(self, terrain_x, terrain_y, obstacles):
+        bodies = []
+        for poly in obstacles:
+            t = self.world.CreateStaticBody(
+                userData=(ROLE_TERRAIN, 0),
+                fixtures=fixtureDef(
+                    shape=polygonShape(vertices=poly),
+                    friction=FRICTION
+                ))
+            t.color1, t.color2 = OBSTACLE_COLORS
+            bodies.append(t)
 
-        self.terrain_poly = []
-        for i in range(TERRAIN_LENGTH - 1):
-            poly = [
-                (self.terrain_x[i], self.terrain_y[i]),
-                (self.terrain_x[i + 1], self.terrain_y[i + 1])
-            ]
+        points = np.column_stack((terrain_x, terrain_y)).tolist()
+        if self.chain_terrain:
+            # Whole ground surface as one body with one chain fixture
             t = self.world.CreateStaticBody(
+                userData=(ROLE_TERRAIN, 0),
                 fixtures=fixtureDef(
-                    shape=edgeShape(vertices=poly),
+                    shape=chainShape(vertices_chain=points),
                     friction=FRICTION,
                     categoryBits=0x0001,
                 ))
-            color = (0.3, 1.0 if i % 2 == 0 else 0.8, 0.3)
-            t.color1 = color
-            t.color2 = color
-            self.terrain.append(t)
-            color = (0.4, 0.6, 0.3)
-            poly += [(poly[1][0], 0), (poly[0][0], 0)]
-            self.terrain_poly.append((poly, color))
-        self.terrain.reverse()
-
-    def _generate_clouds(self):
-        # Sorry for the clouds, couldn't resist
-        self.cloud_poly = []
-        for i in range(TERRAIN_LENGTH // 20):
-            x = self.np_random.uniform(0, TERRAIN_LENGTH) * TERRAIN_STEP
-            y = VIEWPORT_H / SCALE * 3 / 4
-            poly = [
-                (x + 15 * TERRAIN_STEP * math.sin(3.14 * 2 * a / 5) + self.np_random.uniform(0, 5 * TERRAIN_STEP),
-                 y + 5 * TERRAIN_STEP * math.cos(3.14 * 2 * a / 5) + self.np_random.uniform(0, 5 * TERRAIN_STEP))
-                for a in range(5)]
-            x1 = min([p[0] for p in poly])
-            x2 = max([p[0] for p in poly])
-            self.cloud_poly.append((poly, x1, x2))
-
-    def _reset(self):
-        self._destroy()
-        self.world.contactListener_bug_workaround = ContactDetector(self)
-        self.world.contactListener = self.world.contactListener_bug_workaround
-        self.game_over = False
-        self.prev_shaping = None
-        self.scroll = 0.0
-        self.lidar_render = 0
-
-        W = VIEWPORT_W / SCALE
-        H = VIEWPORT_H / SCALE
+            t.color1 = t.color2 = GROUND_COLOR
+            bodies.append(t)
+        else:
+            for i in range(len(points) - 1):
+                t = self.world.CreateStaticBody(
+                    userData=(ROLE_TERRAIN, 0),
+                    fixtures=fixtureDef(
+                        shape=edgeShape(vertices=[points[i], points[i + 1]]),
+                        friction=FRICTION,
+                        categoryBits=0x0001,
+                    ))
+                color = (0.3, 1.0 if i % 2 == 0 else 0.8, 0.3)
+                t.color1 = color
+                t.color2 = color
+                bodies.append(t)
+        bodies.reverse()
+        return bodies
+
+    def _add_terrain_chunk(self):
+        chunks = self.terrain_chunks
+        terrain_x, terrain_y, obstacles = self.terrain_generator.next(self.endless_chunk)
+        if chunks:
+            # Start at the previous chunk's last point so the ground has no gap at the seam
+            terrain_x = np.concatenate((chunks[-1][1][-1:], terrain_x))
+            terrain_y = np.concatenate((chunks[-1][2][-1:], terrain_y))
+        bodies = self._terrain_bodies(terrain_x, terrain_y, obstacles)
+        # Rightmost x of the chunk, stairs and pits can reach past its last ground point
+        right = max([terrain_x[-1]] + [p[0] for poly in obstacles for p in poly])
+        chunks.append((bodies, terrain_x, terrain_y, obstacles, ground_polys(terrain_x, terrain_y), right))
+
+        # Clouds scroll at half speed, so they are spread over half the chunk's width
+        start = terrain_x[0] / TERRAIN_STEP / 2
+        for _ in range(max(1, self.endless_chunk // 40)):
+            x = self.np_random.uniform(start, start + self.endless_chunk / 2) * TERRAIN_STEP
+            self.cloud_poly.append(make_cloud(self.np_random, x))
+
+    def _stream_terrain(self, x):
+        # Adds chunks until the course reaches a screen width past x and destroys the ones that are
+        # entirely left of the viewport, then rebuilds the terrain arrays from the live chunks
+        chunks = self.terrain_chunks
+        changed = False
+        while not chunks or chunks[-1][1][-1] < x + VIEWPORT_W / SCALE:
+            self._add_terrain_chunk()
+            changed = True
+        scroll = x - VIEWPORT_W / SCALE / 5
+        while len(chunks) > 1 and chunks[0][5] < scroll - TERRAIN_STEP:
+            for t in chunks.pop(0)[0]:
+                self.world.DestroyBody(t)
+            changed = True
+        if not changed:
+            return
 
-        self._generate_terrain(self.hardcore)
-        self._generate_clouds()
+        self.cloud_poly = [c for c in self.cloud_poly if c[2] >= scroll / 2]
+        self.terrain = [t for chunk in chunks for t in chunk[0]]
+        self.terrain_x = np.concatenate([chunks[0][1]] + [chunk[1][1:] for chunk in chunks[1:]])
+        self.terrain_y = np.concatenate([chunks[0][2]] + [chunk[2][1:] for chunk in chunks[1:]])
+        self.terrain_obstacles = [poly for chunk in chunks for poly in chunk[3]]
+        self.terrain_poly = [poly for chunk in chunks for poly in chunk[4]]
+        self.lidar_segments = None
+        self.render_geometry = None
+        if self.hull:
+            self.drawlist = self.terrain + self.legs + [self.hull]
+
+    def _generate_clouds(self, np_random=None):
+        if np_random is None:
+            np_random = self.np_random
+        self.cloud_poly = generate_clouds(np_random)
+
+    def _use_prefetched_terrain(self, t):
+        # Terrain and clouds generated while the previous episode ran, so reset only builds bodies.
+        # Each prefetch gets its own RNG seeded from np_random, which is never shared with the
+        # thread; episodes are still reproducible from seed(), but differ from prefetch_terrain off
+        future = self.terrain_future
+        if future is not None and future[:2] == (os.getpid(), self.hardcore):
+            terrain = future[2].result()
+        else:
+            # First episode, after seed(), after a hardcore switch or in a forked copy of the env,
+            # whose future was queued on the parent's thread: nothing usable in flight
+            terrain = _prefetch_job(self.np_random.randint(2 ** 31), self.hardcore)
+        self.terrain_index = None
+        self.terrain_x, self.terrain_y, self.terrain_obstacles, self.cloud_poly = terrain
+        if self.timers is not None: t = self.timers.mark('terrain', t)
+        self._create_terrain_bodies()
+        self.terrain_future = (os.getpid(), self.hardcore, _prefetch(self.np_random.randint(2 ** 31), self.hardcore))
+        return t
+
+    def _use_cached_terrain(self, t):
+        # Both terrain helpers take the reset timer's t and return it, having charged the terrain
+        # data to 'terrain'; _reset charges the rest to 'terrain_bodies'
+        key = (self.terrain_seed, self.hardcore, self.terrain_library, self.terrain_id, self.terrain_difficulty)
+        if self.terrain and self.terrain_cache and next(reversed(self.terrain_cache)) == key:
+            self._skip_terrain_draws(self.terrain_cache[key])
+            if self.timers is not None: t = self.timers.mark('terrain', t)
+            return t
+        if not self.terrain_cache and self.terrain:
+            # Switching from per-episode terrain, nothing cached to keep
+            for body in self.terrain:
+                self.world.DestroyBody(body)
+            self.terrain = []
+        for body in self.terrain or []:
+            body.active = False
+
+        entry = self.terrain_cache.pop(key, None)
+        if entry is None:
+            np_random, _ = seeding.np_random(self.terrain_seed)
+            self._generate_terrain(self.hardcore, np_random)
+            self._generate_clouds(np_random)
+            if self.timers is not None: t = self.timers.mark('terrain', t)
+            self._create_terrain_bodies()
+            entry = (self.terrain, self.terrain_x, self.terrain_y, self.terrain_obstacles,
+                     self.terrain_poly, self.cloud_poly, self.terrain_index, np_random.get_state())
+        else:
+            (self.terrain, self.terrain_x, self.terrain_y, self.terrain_obstacles,
+             self.terrain_poly, self.cloud_poly, self.terrain_index, _) = entry
+            if self.timers is not None: t = self.timers.mark('terrain', t)
+            for body in self.terrain:
+                body.active = True
+        self.terrain_cache[key] = entry
+        self._skip_terrain_draws(entry)
+
+        while len(self.terrain_cache) > max(1, self.terrain_cache_size):
+            terrain = self.terrain_cache.popitem(last=False)[1][0]
+            for body in terrain:
+                self.world.DestroyBody(body)
+        return t
+
+    def _skip_terrain_draws(self, entry):
+        # On the first reset after seed(), per-episode terrain would have come from np_random itself;
+        # moving np_random past the same terrain and cloud draws gives the hull the same initial push,
+        # so episodes started right after seed() match the default mode step for step
+        if self.fresh_seed:
+            self.np_random.set_state(entry[7])
+
+    def _create_walkers(self, init_x, init_y):
+        self.legs = []
+        self.joints = []
+        self.hull = self._create_walker(init_x, init_y, 0, self.legs, self.joints)
+        self.lidar = [LidarCallback() for _ in range(10)]
 
-        init_x = TERRAIN_STEP * TERRAIN_STARTPAD / 2
-        init_y = TERRAIN_HEIGHT + 2 * LEG_H
-        self.hull = self.world.CreateDynamicBody(
+    def _create_walker(self, init_x, init_y, index, legs, joints):
+        # Hull at (init_x, init_y) with the hull index in its userData, the four leg bodies and
+        # their joints are appended to legs and joints; a leg's userData index is its position in legs
+        hull = self.world.CreateDynamicBody(
             position=(init_x, init_y),
+            userData=(ROLE_HULL, index),
             fixtures=fixtureDef(
-                shape=polygonShape(vertices=[(x / SCALE, y / SCALE) for x, y in HULL_POLY]),
+                shape=polygonShape(vertices=HULL_VERTICES),
                 density=5.0,
                 friction=0.1,
                 categoryBits=0x0020,
                 maskBits=0x001,  # collide only with ground
                 restitution=0.0)  # 0.99 bouncy
         )
-        self.hull.color1 = (0.5, 0.4, 0.9)
-        self.hull.color2 = (0.3, 0.3, 0.5)
-        self.hull.ApplyForceToCenter((self.np_random.uniform(-INITIAL_RANDOM, INITIAL_RANDOM), 0), True)
+        hull.color1, hull.color2 = HULL_COLORS
+        hull.ApplyForceToCenter((self.np_random.uniform(-INITIAL_RANDOM, INITIAL_RANDOM), 0), True)
 
-        self.legs = []
-        self.joints = []
         for i in [-1, +1]:
             leg = self.world.CreateDynamicBody(
                 position=(init_x, init_y - LEG_H / 2 - LEG_DOWN),
+                userData=(ROLE_LEG, len(legs)),
                 angle=(i * 0.05),
                 fixtures=fixtureDef(
-                    shape=polygonShape(box=(LEG_W / 2, LEG_H / 2)),
+                    shape=polygonShape(box=LEG_BOX),
                     density=1.0,
                     restitution=0.0,
                     categoryBits=0x0020,
                     maskBits=0x001)
             )
-            leg.color1 = (0.6 - i / 10., 0.3 - i / 10., 0.5 - i / 10.)
-            leg.color2 = (0.4 - i / 10., 0.2 - i / 10., 0.3 - i / 10.)
+            leg.color1, leg.color2 = leg_colors(i)
             rjd = revoluteJointDef(
-                bodyA=self.hull,
+                bodyA=hull,
                 bodyB=leg,
                 localAnchorA=(0, LEG_DOWN),
                 localAnchorB=(0, LEG_H / 2),
@@ -324,21 +724,21 @@ class BipedalWalker(gym.Env):
                 lowerAngle=-0.8,
                 upperAngle=1.1,
             )
-            self.legs.append(leg)
-            self.joints.append(self.world.CreateJoint(rjd))
+            legs.append(leg)
+            joints.append(self.world.CreateJoint(rjd))
 
             lower = self.world.CreateDynamicBody(
                 position=(init_x, init_y - LEG_H * 3 / 2 - LEG_DOWN),
+                userData=(ROLE_LOWER_LEG, len(legs)),
                 angle=(i * 0.05),
                 fixtures=fixtureDef(
-                    shape=polygonShape(box=(0.8 * LEG_W / 2, LEG_H / 2)),
+                    shape=polygonShape(box=LOWER_LEG_BOX),
                     density=1.0,
                     restitution=0.0,
                     categoryBits=0x0020,
                     maskBits=0x001)
             )
-            lower.color1 = (0.6 - i / 10., 0.3 - i / 10., 0.5 - i / 10.)
-            lower.color2 = (0.4 - i / 10., 0.2 - i / 10., 0.3 - i / 10.)
+            lower.color1, lower.color2 = leg_colors(i)
             rjd = revoluteJointDef(
                 bodyA=leg,
                 bodyB=lower,
@@ -352,282 +752,377 @@ class BipedalWalker(gym.Env):
                 upperAngle=-0.1,
             )
             lower.ground_contact = False
-            self.legs.append(lower)
-            self.joints.append(self.world.CreateJoint(rjd))
+            legs.append(lower)
+            joints.append(self.world.CreateJoint(rjd))
 
-        self.drawlist = self.terrain + self.legs + [self.hull]
-
-        class LidarCallback(Box2D.b2.rayCastCallback):
-            def ReportFixture(self, fixture, point, normal, fraction):
-                if (fixture.filterData.categoryBits & 1) == 0:
-                    return 1
-                self.p2 = point
-                self.fraction = fraction
-                return 0
+        return hull
 
-        self.lidar = [LidarCallback() for _ in range(10)]
+    def _reset(self):
+        timers = self.timers
+        t = timers.start() if timers is not None else None
+        if self.persistent_terrain and not self.endless:
+            self._destroy_walker()
+        else:
+            self._destroy()
+        if timers is not None: t = timers.mark('destroy', t)
+        self.world.contactListener_bug_workaround = self.contact_detector
+        self.world.contactListener = self.world.contactListener_bug_workaround
+        self.game_over = False
+        self.prev_shaping = None
+        self.scroll = 0.0
+        self.lidar_render = 0
+        self.lidar_segments = None
+        self.render_geometry = None
+        # Hull x of the last stall_window steps, as a ring indexed by stall_steps. The window is
+        # fixed for the episode by the ring's length, None when the check is off
+        self.stall_steps = 0
+        self.stall_history = np.empty(self.stall_window) if self.stall_window else None
 
-        return self._step(np.array([0, 0, 0, 0]))[0]
+        W = VIEWPORT_W / SCALE
+        H = VIEWPORT_H / SCALE
 
-    def _step(self, action):
-        # self.hull.ApplyForceToCenter((0, 20), True) -- Uncomment this to receive a bit of stability help
-        control_speed = False  # Should be easier as well
-        if control_speed:
-            self.joints[0].motorSpeed = float(SPEED_HIP * np.clip(action[0], -1, 1))
-            self.joints[1].motorSpeed = float(SPEED_KNEE * np.clip(action[1], -1, 1))
-            self.joints[2].motorSpeed = float(SPEED_HIP * np.clip(action[2], -1, 1))
-            self.joints[3].motorSpeed = float(SPEED_KNEE * np.clip(action[3], -1, 1))
+        if self.endless:
+            self.terrain_index = None
+            self.terrain_generator = TerrainGenerator(self.np_random, self.hardcore)
+            self.terrain_chunks = []
+            self.cloud_poly = []
+            # Chunks are generated and turned into bodies as one step, all charged to 'terrain'
+            self._stream_terrain(TERRAIN_STEP * TERRAIN_STARTPAD / 2)
+            if timers is not None: t = timers.mark('terrain', t)
+        elif self.persistent_terrain:
+            t = self._use_cached_terrain(t)
+        elif self.prefetch_terrain and self.terrain_library is None:
+            t = self._use_prefetched_terrain(t)
         else:
-            self.joints[0].motorSpeed = float(SPEED_HIP * np.sign(action[0]))
-            self.joints[0].maxMotorTorque = float(MOTORS_TORQUE * np.clip(np.abs(action[0]), 0, 1))
-            self.joints[1].motorSpeed = float(SPEED_KNEE * np.sign(action[1]))
-            self.joints[1].maxMotorTorque = float(MOTORS_TORQUE * np.clip(np.abs(action[1]), 0, 1))
-            self.joints[2].motorSpeed = float(SPEED_HIP * np.sign(action[2]))
-            self.joints[2].maxMotorTorque = float(MOTORS_TORQUE * np.clip(np.abs(action[2]), 0, 1))
-            self.joints[3].motorSpeed = float(SPEED_KNEE * np.sign(action[3]))
-            self.joints[3].maxMotorTorque = float(MOTORS_TORQUE * np.clip(np.abs(action[3]), 0, 1))
+            self._generate_terrain(self.hardcore)
+            self._generate_clouds()
+            if timers is not None: t = timers.mark('terrain', t)
+            self._create_terrain_bodies()
+        self.fresh_seed = False
+        if timers is not None: t = timers.mark('terrain_bodies', t)
 
-        self.world.Step(1.0 / FPS, 6 * 30, 2 * 30)
+        init_x = TERRAIN_STEP * TERRAIN_STARTPAD / 2
+        init_y = TERRAIN_HEIGHT + 2 * LEG_H
+        self._create_walkers(init_x, init_y)
 
-        pos = self.hull.position
-        vel = self.hull.linearVelocity
+        self.drawlist = self.terrain + self.legs + [self.hull]
+        if timers is not None: timers.mark('bodies', t)
 
-        for i in range(10):
-            self.lidar[i].fraction = 1.0
-            self.lidar[i].p1 = pos
-            self.lidar[i].p2 = (
-                pos[0] + math.sin(1.5 * i / 10.0) * LIDAR_RANGE,
-                pos[1] - math.cos(1.5 * i / 10.0) * LIDAR_RANGE)
-            self.world.RayCast(self.lidar[i], self.lidar[i].p1, self.lidar[i].p2)
+        return self._step(np.array([0, 0, 0, 0]))[0]
 
-        state = [
-            self.hull.angle,  # Normal angles up to 0.5 here, but sure more is possible.
-            2.0 * self.hull.angularVelocity / FPS,
-            0.3 * vel.x * (VIEWPORT_W / SCALE) / FPS,  # Normalized to get -1..1 range
-            0.3 * vel.y * (VIEWPORT_H / SCALE) / FPS,
-            self.joints[0].angle,
-            # This will give 1.1 on high up, but it's still OK (and there should be spikes on hiting the ground, that's normal too)
-            self.joints[0].speed / SPEED_HIP,
-            self.joints[1].angle + 1.0,
-            self.joints[1].speed / SPEED_KNEE,
-            1.0 if self.legs[1].ground_contact else 0.0,
-            self.joints[2].angle,
-            self.joints[2].speed / SPEED_HIP,
-            self.joints[3].angle + 1.0,
-            self.joints[3].speed / SPEED_KNEE,
-            1.0 if self.legs[3].ground_contact else 0.0
-        ]
-        state += [l.fraction for l in self.lidar]
-        assert len(state) == 24
+    def _step(self, action):
+        state = np.empty(24)
+        _, reward, done, info = self.step_into(action, state)
+        return state, reward, done, info
+
+    def step_into(self, action, out=None):
+        # Same as step(), but the observation is written into out (any float dtype, shape (24,))
+        # instead of a new array. Without out, the env's own float32 buffer is filled and returned,
+        # it is overwritten by the next step_into call.
+        if out is None:
+            out = self.obs_buffer
+        timers = self.timers
+        if timers is not None: t = timers.start()
+        torque = self._apply_action(action)
+        if timers is not None: t = timers.mark('action', t)
+
+        # With frame_skip > 1 the action is held for several physics ticks and their rewards are
+        # summed; lidar and observation are only computed after the last tick
+        reward = 0
+        for _ in range(self.frame_skip):
+            self._world_step()
+            if timers is not None: t = timers.mark('world_step', t)
+            tick_reward, done = self._tick_reward(torque)
+            reward += tick_reward
+            if timers is not None: t = timers.mark('reward', t)
+            if done:
+                break
 
-        self.scroll = pos.x - VIEWPORT_W / SCALE / 5
+        pos = self.hull.position
+        if self.endless:
+            self._stream_terrain(pos.x)
+            if timers is not None: t = timers.mark('terrain', t)
+        self._cast_lidar(pos)
+        if timers is not None: t = timers.mark('lidar', t)
+        self._observe(out)
+        if timers is not None: timers.mark('observation', t)
 
+        self.scroll = pos.x - VIEWPORT_W / SCALE / 5
+        if self.stall_history is not None and self._stalled(pos.x) and not done:
+            return out, reward, True, {'stalled': True}
+        return out, reward, done, {}
+
+    def _stalled(self, x):
+        window = len(self.stall_history)
+        k = self.stall_steps % window
+        stalled = self.stall_steps >= window and x - self.stall_history[k] < self.stall_min_progress
+        self.stall_history[k] = x
+        self.stall_steps += 1
+        return stalled
+
+    def _tick_reward(self, torque):
+        pos = self.hull.position
         shaping = 130 * pos[
             0] / SCALE  # moving forward is a way to receive reward (normalized to get 300 on completion)
-        shaping -= 5.0 * abs(state[0])  # keep head straight, other than that and falling, any behavior is unpunished
+        shaping -= 5.0 * abs(self.hull.angle)  # keep head straight, other than that and falling, any behavior is unpunished
 
         reward = 0
         if self.prev_shaping is not None:
             reward = shaping - self.prev_shaping
         self.prev_shaping = shaping
 
-        for a in action:
-            reward -= 0.00035 * MOTORS_TORQUE * np.clip(np.abs(a), 0, 1)
+        for t in torque:
+            reward -= 0.00035 * MOTORS_TORQUE * t
             # normalized to about -50.0 using heuristic, more optimal agent should spend less
 
         done = False
-        if self.game_over or pos[0] < 0:
+        # Walking off the left end of the course counts as a fall, in endless mode that end moves
+        if self.game_over or pos[0] < self.terrain_x[0]:
             reward = -100
             done = True
-        if pos[0] > (TERRAIN_LENGTH - TERRAIN_GRASS) * TERRAIN_STEP:
+        if not self.endless and pos[0] > (TERRAIN_LENGTH - TERRAIN_GRASS) * TERRAIN_STEP:
             done = True
-        return np.array(state), reward, done, {}
+        return reward, done
 
-    def _render(self, mode='human', close=False):
-        if close:
-            if self.viewer is not None:
-                self.viewer.close()
-                self.viewer = None
-            return
+    def _world_step(self):
+        substeps, velocity_iterations, position_iterations = FIDELITY_PROFILES[self.fidelity]
+        for _ in range(substeps):
+            self.world.Step(1.0 / FPS / substeps, velocity_iterations, position_iterations)
 
-        from gym.envs.classic_control import rendering
-        if self.viewer is None:
-            self.viewer = rendering.Viewer(VIEWPORT_W, VIEWPORT_H)
-        self.viewer.set_bounds(self.scroll, VIEWPORT_W / SCALE + self.scroll, 0, VIEWPORT_H / SCALE)
-
-        self.viewer.draw_polygon([
-            (self.scroll, 0),
-            (self.scroll + VIEWPORT_W / SCALE, 0),
-            (self.scroll + VIEWPORT_W / SCALE, VIEWPORT_H / SCALE),
-            (self.scroll, VIEWPORT_H / SCALE),
-        ], color=(0.9, 0.9, 1.0))
-        for poly, x1, x2 in self.cloud_poly:
-            if x2 < self.scroll / 2: continue
-            if x1 > self.scroll / 2 + VIEWPORT_W / SCALE: continue
-            self.viewer.draw_polygon([(p[0] + self.scroll / 2, p[1]) for p in poly], color=(1, 1, 1))
-        for poly, color in self.terrain_poly:
-            if poly[1][0] < self.scroll: continue
-            if poly[0][0] > self.scroll + VIEWPORT_W / SCALE: continue
-            self.viewer.draw_polygon(poly, color=color)
+    def _apply_action(self, action):
+        # Clips the action once into a preallocated buffer, returns the per-joint torque fractions
+        a = np.clip(action, -1, 1, out=self.action_buffer)
+        a0, a1, a2, a3 = a[0].item(), a[1].item(), a[2].item(), a[3].item()
 
-        self.lidar_render = (self.lidar_render + 1) % 100
-        i = self.lidar_render
-        if i < 2 * len(self.lidar):
-            l = self.lidar[i] if i < len(self.lidar) else self.lidar[len(self.lidar) - i - 1]
-            self.viewer.draw_polyline([l.p1, l.p2], color=(1, 0, 0), linewidth=1)
+        # self.hull.ApplyForceToCenter((0, 20), True) -- Uncomment this to receive a bit of stability help
+        control_speed = False  # Should be easier as well
+        if control_speed:
+            self.joints[0].motorSpeed = SPEED_HIP * a0
+            self.joints[1].motorSpeed = SPEED_KNEE * a1
+            self.joints[2].motorSpeed = SPEED_HIP * a2
+            self.joints[3].motorSpeed = SPEED_KNEE * a3
+        else:
+            self.joints[0].motorSpeed = SPEED_HIP * float((a0 > 0) - (a0 < 0))
+            self.joints[0].maxMotorTorque = MOTORS_TORQUE * abs(a0)
+            self.joints[1].motorSpeed = SPEED_KNEE * float((a1 > 0) - (a1 < 0))
+            self.joints[1].maxMotorTorque = MOTORS_TORQUE * abs(a1)
+            self.joints[2].motorSpeed = SPEED_HIP * float((a2 > 0) - (a2 < 0))
+            self.joints[2].maxMotorTorque = MOTORS_TORQUE * abs(a2)
+            self.joints[3].motorSpeed = SPEED_KNEE * float((a3 > 0) - (a3 < 0))
+            self.joints[3].maxMotorTorque = MOTORS_TORQUE * abs(a3)
+        return abs(a0), abs(a1), abs(a2), abs(a3)
+
+    def _cast_lidar(self, pos):
+        if self.lidar_engine == 'numpy':
+            self._numpy_lidar(pos)
+            return
+        for i in range(10):
+            self.lidar[i].fraction = 1.0
+            self.lidar[i].p1 = pos
+            self.lidar[i].p2 = (
+                pos[0] + math.sin(1.5 * i / 10.0) * LIDAR_RANGE,
+                pos[1] - math.cos(1.5 * i / 10.0) * LIDAR_RANGE)
+            self.world.RayCast(self.lidar[i], self.lidar[i].p1, self.lidar[i].p2)
 
-        for obj in self.drawlist:
+    def _observe(self, out):
+        vel = self.hull.linearVelocity
+        joints = self.joints
+        out[0] = self.hull.angle  # Normal angles up to 0.5 here, but sure more is possible.
+        out[1] = 2.0 * self.hull.angularVelocity / FPS
+        out[2] = 0.3 * vel.x * (VIEWPORT_W / SCALE) / FPS  # Normalized to get -1..1 range
+        out[3] = 0.3 * vel.y * (VIEWPORT_H / SCALE) / FPS
+        out[4] = joints[0].angle
+        # This will give 1.1 on high up, but it's still OK (and there should be spikes on hiting the ground, that's normal too)
+        out[5] = joints[0].speed / SPEED_HIP
+        out[6] = joints[1].angle + 1.0
+        out[7] = joints[1].speed / SPEED_KNEE
+        out[8] = 1.0 if self.legs[1].ground_contact else 0.0
+        out[9] = joints[2].angle
+        out[10] = joints[2].speed / SPEED_HIP
+        out[11] = joints[3].angle + 1.0
+        out[12] = joints[3].speed / SPEED_KNEE
+        out[13] = 1.0 if self.legs[3].ground_contact else 0.0
+        for i, l in enumerate(self.lidar):
+            out[14 + i] = l.fraction
+        return out
+
+    def clone_state(self):
+        # Snapshot of the walker bodies, motors, contact flags, episode bookkeeping and RNG, to be
+        # passed to restore_state() later in the same episode (terrain is not part of the snapshot).
+        # Box2D contact warm-starting is not captured, so a restored run can drift slightly from
+        # the original one.
+        if self.endless:
+            raise ValueError("clone_state() is not supported with endless terrain")
+        return {
+            'terrain': self.terrain,
+            'bodies': [(tuple(b.position), b.angle, tuple(b.linearVelocity), b.angularVelocity, b.awake)
+                       for b in [self.hull] + self.legs],
+            'joints': [(j.motorSpeed, j.maxMotorTorque) for j in self.joints],
+            'ground_contact': [leg.ground_contact for leg in self.legs[1::2]],
+            'lidar': [(l.fraction, tuple(l.p1), tuple(l.p2)) for l in self.lidar],
+            'prev_shaping': self.prev_shaping,
+            'game_over': self.game_over,
+            'scroll': self.scroll,
+            'lidar_render': self.lidar_render,
+            'stall': (self.stall_steps, None if self.stall_history is None else self.stall_history.copy()),
+            'np_random': self.np_random.get_state(),
+        }
+
+    def restore_state(self, snapshot):
+        if self.endless:
+            raise ValueError("restore_state() is not supported with endless terrain")
+        if snapshot['terrain'] is not self.terrain:
+            raise ValueError("snapshot was taken on a different terrain, restore it in the same episode")
+        for b, (position, angle, linear_velocity, angular_velocity, awake) in zip(
+                [self.hull] + self.legs, snapshot['bodies']):
+            b.position = position
+            b.angle = angle
+            b.linearVelocity = linear_velocity
+            b.angularVelocity = angular_velocity
+            b.awake = awake
+        for j, (motor_speed, max_motor_torque) in zip(self.joints, snapshot['joints']):
+            j.motorSpeed = motor_speed
+            j.maxMotorTorque = max_motor_torque
+        for leg, contact in zip(self.legs[1::2], snapshot['ground_contact']):
+            leg.ground_contact = contact
+        for l, (fraction, p1, p2) in zip(self.lidar, snapshot['lidar']):
+            l.fraction, l.p1, l.p2 = fraction, p1, p2
+        self.prev_shaping = snapshot['prev_shaping']
+        self.game_over = snapshot['game_over']
+        self.scroll = snapshot['scroll']
+        self.lidar_render = snapshot['lidar_render']
+        self.stall_steps, history = snapshot['stall']
+        self.stall_history = None if history is None else history.copy()
+        self.np_random.set_state(snapshot['np_random'])
+
+    def render_snapshot(self, out=None):
+        # Everything that changes between frames, as a flat float array of RENDER_SNAPSHOT_SIZE;
+        # the static part of a frame is terrain_x, terrain_y, terrain_obstacles and cloud_poly
+        if out is None:
+            out = np.empty(RENDER_SNAPSHOT_SIZE)
+        for k, b in enumerate([self.hull] + self.legs):
+            position = b.position
+            out[3 * k] = position[0]
+            out[3 * k + 1] = position[1]
+            out[3 * k + 2] = b.angle
+        out[15] = self.scroll
+        p1 = self.lidar[0].p1
+        out[16] = p1[0]
+        out[17] = p1[1]
+        for i, l in enumerate(self.lidar):
+            out[18 + 2 * i] = l.p2[0]
+            out[19 + 2 * i] = l.p2[1]
+        return out
+
+    def _numpy_lidar(self, pos):
+        if self.lidar_segments is None:
+            self.lidar_segments = TerrainSegments(self.terrain_x, self.terrain_y, self.terrain_obstacles)
+        p1 = np.empty((10, 2))
+        p1[:] = pos[0], pos[1]
+        fractions, points = self.lidar_segments.raycast(p1, p1 + LIDAR_OFFSETS)
+        for i, l in enumerate(self.lidar):
+            l.fraction = float(fractions[i])
+            l.p1 = pos
+            l.p2 = (points[i, 0], points[i, 1])
+
+    def _prepare_render_geometry(self):
+        # Clouds and terrain fixtures in world coordinates, sorted by left x so _render can bisect
+        # to the visible ones. Built on the first render after a reset.
+        clouds = sorted(self.cloud_poly, key=lambda c: c[1])
+        static = []
+        for body in self.terrain:
+            trans = body.transform
+            for f in body.fixtures:
+                path = [tuple(trans * v) for v in f.shape.vertices]
+                if type(f.shape) is chainShape:
+                    # One open segment per item, a whole-course item would defeat the culling
+                    static += [(min(a[0], b[0]), max(a[0], b[0]), False, [a, b], body.color1, body.color2)
+                               for a, b in zip(path[:-1], path[1:])]
+                else:
+                    xs = [p[0] for p in path]
+                    static.append((min(xs), max(xs), True, path, body.color1, body.color2))
+        static.sort(key=lambda item: item[0])
+        self.render_geometry = {
+            'clouds': clouds,
+            'cloud_x1': [c[1] for c in clouds],
+            'cloud_width': max([c[2] - c[1] for c in clouds] or [0]),
+            'terrain_x1': [poly[0][0] for poly, _ in self.terrain_poly],
+            'static': static,
+            'static_x1': [item[0] for item in static],
+            'static_width': max([item[1] - item[0] for item in static] or [0]),
+        }
+
+    def _draw_walkers(self, viewer):
+        self._draw_bodies(viewer, self.legs + [self.hull])
+
+    def _draw_bodies(self, viewer, bodies):
+        for obj in bodies:
             for f in obj.fixtures:
                 trans = f.body.transform
                 if type(f.shape) is circleShape:
-                    t = rendering.Transform(translation=trans * f.shape.pos)
-                    self.viewer.draw_circle(f.shape.radius, 30, color=obj.color1).add_attr(t)
-                    self.viewer.draw_circle(f.shape.radius, 30, color=obj.color2, filled=False, linewidth=2).add_attr(t)
+                    # Drawn as a 30-gon so both backends can take it
+                    center = trans * f.shape.pos
+                    path = [(center[0] + math.cos(2 * math.pi * k / 30) * f.shape.radius,
+                             center[1] + math.sin(2 * math.pi * k / 30) * f.shape.radius) for k in range(30)]
+                    draw_outlined(viewer, path, obj.color1, obj.color2)
                 else:
-                    path = [trans * v for v in f.shape.vertices]
-                    self.viewer.draw_polygon(path, color=obj.color1)
-                    path.append(path[0])
-                    self.viewer.draw_polyline(path, color=obj.color2, linewidth=2)
+                    draw_outlined(viewer, [trans * v for v in f.shape.vertices], obj.color1, obj.color2)
 
-        flagy1 = TERRAIN_HEIGHT
-        flagy2 = flagy1 + 50 / SCALE
-        x = TERRAIN_STEP * 3
-        self.viewer.draw_polyline([(x, flagy1), (x, flagy2)], color=(0, 0, 0), linewidth=2)
-        f = [(x, flagy2), (x, flagy2 - 10 / SCALE), (x + 25 / SCALE, flagy2 - 5 / SCALE)]
-        self.viewer.draw_polygon(f, color=(0.9, 0.2, 0))
-        self.viewer.draw_polyline(f + [f[0]], color=(0, 0, 0), linewidth=2)
-
-        return self.viewer.render(return_rgb_array=mode == 'rgb_array')
-
-
-class BipedalWalkerHardcore(BipedalWalker):
-    hardcore = True
+    def _render(self, mode='human', close=False):
+        if close:
+            if self.viewer is not None:
+                self.viewer.close()
+                self.viewer = None
+            self.software_viewer = None
+            return
 
+        if mode == 'rgb_array' and self.render_backend == 'numpy':
+            if self.software_viewer is None:
+                self.software_viewer = SoftwareRenderer(VIEWPORT_W, VIEWPORT_H)
+            viewer = self.software_viewer
+        else:
+            from gym.envs.classic_control import rendering
+            if self.viewer is None:
+                self.viewer = rendering.Viewer(VIEWPORT_W, VIEWPORT_H)
+            viewer = self.viewer
+        viewer.set_bounds(self.scroll, VIEWPORT_W / SCALE + self.scroll, 0, VIEWPORT_H / SCALE)
+
+        draw_sky(viewer, self.scroll)
+        if self.render_geometry is None:
+            self._prepare_render_geometry()
+        geometry = self.render_geometry
+
+        left = self.scroll / 2
+        lo, hi = _visible_range(geometry['cloud_x1'], geometry['cloud_width'], left, left + VIEWPORT_W / SCALE)
+        draw_clouds(viewer, geometry['clouds'][lo:hi], self.scroll)
+        left = self.scroll
+        right = self.scroll + VIEWPORT_W / SCALE
+        lo, hi = _visible_range(geometry['terrain_x1'], TERRAIN_STEP, left, right)
+        draw_ground_fill(viewer, self.terrain_poly[lo:hi], self.scroll)
 
-def get_power(a):
-    if a == -0.1:
-        return 1
-    if a == 0:
-        return 0
-    return 2
-
-
-if __name__ == "__main__":
-    # #site-ul sursa: https://www.tensorflow.org/get_started/mnist/pros
-    #
-    # #added some code to evaluate the way we will implement the neuronal network
-    # #we have to decide how and in which way will we implement it
-    # sess = tf.InteractiveSession()
-    # W = tf.Variable(tf.zeros([24, 4]))
-    # #s are 24 de campuri si ar trebui sa aiba 4 output-uri
-    # b = tf.Variable(tf.zeros([4]))
-    # y = tf.nn.softmax(tf.matmul(x, W) + b)#pentru iteratii
-    # sess.run(tf.global_variables_initializer())
-    #
-    # #cross_entropy = tf.reduce_mean(-tf.reduce_sum(y_ * tf.log(y), reduction_indices=[1]))
-    # cross_entropy = tf.reduce_mean(
-    #     tf.nn.softmax_cross_entropy_with_logits(labels=y_, logits=y))
-    # train_step = tf.train.AdamOptimizer(1e-4).minimize(cross_entropy)
-    #
-    # #iteratii
-    # train_step = tf.train.GradientDescentOptimizer(0.5).minimize(cross_entropy)
-    # correct_prediction = tf.equal(tf.argmax(y, 1), tf.argmax(y_, 1)) #aici trebuie implementata functia de activare
-    # accuracy = tf.reduce_mean(tf.cast(correct_prediction, tf.float32))
-
-    env = BipedalWalker()
-    env.reset()
-    steps = 0
-
-    random.seed(12345)
-    model = Sequential()
-    model.add(Dense(0.2, input_shape=(24,)))
-    model.add(Dense(30, input_shape=(24,), activation='sigmoid'))
-    model.add(Dense(81, activation='softmax'))
-
-    optimizer = SGD(lr=0.05, momentum=0.8)
-
-    model.compile(optimizer=optimizer, loss='categorical_crossentropy',
-                  metrics=['accuracy'])
-
-    last_state = np.zeros(24)
-    last_move_index = 0
-    discount_factor = 0.5
-    possible_moves = [-0.1, 0, 0.1]
-
-    # functie de clip pentru valori -1 -> 1 (sau -0.1 -> 0.1)
-    # functie de explorare, ca sa nu ia chiar intotdeauna cea mai buna solutie
-    # acesta functie de explorare sa aiba o probabilitate mai mica cu cat au trecut mai multe iteratii
-    # dupa ce a invatat destul aplicam algoritmul de Q-learning care invata si updateaza ultimii 100 de pasi pe formula
-    #                                           scrisa pe caiet
-    # alte chestii de care am uitat, in principiu optimizari presupun
-    for i in range(0, 100):
-        total_reward = 0
-        env.reset()
-        a = np.array([0.0, 0.0, 0.0, 0.0])
-        steps = 0
-        last_100_steps = []
-        while True:
-            current_state, current_reward, done, info = env.step(a)
-            old_state = np.array([last_state])
-            old_state_adjust_value = np.array([np.zeros(81)])
-            old_state_adjust_value[0][last_move_index] = total_reward
-
-            model.train_on_batch(old_state, old_state_adjust_value)
-
-            total_reward += current_reward
-            if steps % 100 == 0:
-                print("Current Reward" + str(current_reward))
-                print("Total Reward"+str(total_reward))
-            steps += 1
-            if steps == 100:
-                done = True
-                current_reward = -1000
-
-            best_score = -2018
-            best_index = 0
-            state = list(current_state)
-
-            random_move = random.randrange(0, 100)
-            if random_move > 10:
-                score = model.predict(np.array([state]), batch_size=1)
-                for x in range(0, 81):
-                    if score[0][x] > best_score:
-                        best_score = score[0][x]
-                        best_index = x
+        self.lidar_render = (self.lidar_render + 1) % 100
+        i = lidar_beam(self.lidar_render)
+        if i is not None:
+            draw_lidar(viewer, self.lidar[i].p1, self.lidar[i].p2)
+
+        lo, hi = _visible_range(geometry['static_x1'], geometry['static_width'], left, right)
+        for x1, x2, filled, path, color1, color2 in geometry['static'][lo:hi]:
+            if x2 < left: continue
+            if filled:
+                draw_outlined(viewer, path, color1, color2)
             else:
-                random_move = random.randrange(0, 81)
-                best_index = random_move
-
-            a = np.array([a[0], a[1], a[2], a[3]])
-            move_index = best_index
-            for i in reversed(range(0, 4)):
-                power = pow(3, i)
-                aux = move_index // power
-                a[i] += possible_moves[aux]
-
-                if a[i] > 1:
-                    a[i] = 1
-                if a[i] < -1:
-                    a[i] = -1
-
-                move_index = move_index - power * (move_index // power)
+                viewer.draw_polyline(path, color=color2, linewidth=2)
 
-            last_move_index = best_index
-            last_state = state
+        # Only the walker moves, it is the only geometry transformed per frame
+        self._draw_walkers(viewer)
 
-            last_100_steps.append((last_state, last_move_index))
+        draw_flag(viewer)
 
-            env.render()
-            if done:
-                decay = len(last_100_steps)
-                for i in reversed(range(0, len(last_100_steps))):
-                    step_state = last_100_steps[i][0]
-                    step_index = last_100_steps[i][1]
+        if viewer is self.software_viewer:
+            # A new array per call like pyglet's Viewer, the renderer itself reuses one buffer
+            return viewer.render().copy()
+        return viewer.render(return_rgb_array=mode == 'rgb_array')
 
-                    old_state = np.array([step_state])
-                    old_state_adjust_value = np.array([np.zeros(81)])
-                    old_state_adjust_value[0][step_index] = current_reward * (decay / len(last_100_steps)/100)
 
-                    model.train_on_batch(old_state, old_state_adjust_value)
-                    decay -= 1
-                break
+class BipedalWalkerHardcore(BipedalWalker):
+    hardcore = True